@@ -2,8 +2,12 @@
 This module allows users to:
     - select country or the whole world
     - get the overall statistical analyzing information of chosen country
+    - export it as a report of plain python values
+    - get the rolling statistics and recent trends of all the countries
+    - flag the years of sudden spikes on the line plot
+    - forecast the next years of the line plot
     - visualize the terrorism caused occurrences, casualties, deaths or wounds
-    - make 'smooth line' visualization
+    - make 'smooth line' visualization, with cached smooth lines
     - select feature
     - customize color
 
@@ -16,8 +20,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import data
-from scipy.interpolate import spline
-from ipywidgets import interact, ColorPicker, Dropdown
+from functools import lru_cache
+import disk_cache
+from smoothing import SplineSmoother
+from trends import RollingStats
+from anomaly import detect_anomalies
+from forecast import HoltForecast
+from ipywidgets import interact, ColorPicker, Dropdown, IntSlider
 from UserError import NoCountryDataError
 
 
@@ -76,15 +85,15 @@ def df_occur_by_ctr_allyears(ctr_name):
     return df_full_yr[['year', 'occurrences']]
 
 
-def gtd_country_names():
+def gtd_country_names(profiles=None):
     '''
     Return a list of:
         - all country names in alphabetical order, plus
         - 'The Whole World'
     '''
-    all_ctr = sorted(data.load_df().country.unique())
-    all_ctr.insert(0, 'The Whole World')
-    return all_ctr
+    if profiles is None:
+        profiles = country_profiles()
+    return list(profiles.countries)
 
 
 def drop93(df):
@@ -112,10 +121,216 @@ def df_ctr(Country):
     return df_ctr.drop(['eventid', 'latitude', 'longitude'], 1)
 
 
-def df_ctr_all(Country):
+# years in the GT Database, 1993 is not available
+YEARS = [year for year in range(1970, 2016) if year != 1993]
+
+# features of the yearly series, in the order of df_ctr_all
+PROFILE_FEATURES = ['kills', 'wounds', 'casualties', 'occurrences']
+
+# number of years in the window of the rolling statistics
+TREND_WINDOW = 5
+
+# metrics checked for sudden spikes
+ANOMALY_METRICS = ['occurrences', 'casualties']
+
+# robust z-score above which a year is flagged as a sudden spike
+ANOMALY_THRESHOLD = 3.5
+
+# largest number of years to forecast
+MAX_FORECAST_YEARS = 10
+
+# statistics of the analysis, in the order of DataFrame.describe, plus the sum
+STATISTICS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max', 'sum']
+
+
+class CountryProfiles(object):
+    '''
+    Attributes:
+        - self.countries: 'The Whole World' followed by
+                          all country names in alphabetical order
+        - self.series:    yearly number of kills, wounds, casualties and occurrences
+                          of every country (excluding 1993), indexed by country    | DataFrame
+        - self.stats:     statistics of the yearly series of every country,
+                          indexed by country and feature                            | DataFrame
+    Method:
+        - get the yearly series of a country
+        - get the statistics of a country
+        - get the rolling statistics and trends of all the countries
+        - get the sudden spikes of all the countries
+        - get the forecasts of all the countries
+    ---
+    All the countries are grouped in one pass,
+    so switching the country only looks the tables up.
+    '''
+    def __init__(self, df=None):
+        if df is None:
+            df = data.load_df()
+        countries = sorted(df.country.unique())
+        self.countries = ['The Whole World'] + countries
+
+        by_country = self.aggregate(df.groupby(['country', 'year']))
+        by_world = self.aggregate(df.groupby('year'))
+        by_world.index = pd.MultiIndex.from_product([['The Whole World'], by_world.index],
+                                                    names=['country', 'year'])
+        # fill the non-attack years with zeros
+        full_index = pd.MultiIndex.from_product([self.countries, YEARS], names=['country', 'year'])
+        series = pd.concat([by_world, by_country]).reindex(full_index).fillna(0)
+        self.series = series.reset_index(level='year')
+
+        grouped = self.series.groupby(level='country', sort=False)
+        stats = pd.concat([grouped.count(), grouped.mean(), grouped.std(),
+                           grouped.min(), grouped.quantile(.25), grouped.quantile(.5),
+                           grouped.quantile(.75), grouped.max(), grouped.sum()],
+                          axis=1, keys=STATISTICS)
+        stats.columns.names = ['statistic', 'feature']
+        self.stats = stats.stack('feature')[STATISTICS]
+        self._rolling = {}
+        self._anomalies = None
+        self._forecasts = {}
+
+    @staticmethod
+    def aggregate(grouped):
+        '''
+        Return the sums of kills, wounds and casualties
+        and the number of occurrences of every group         | DataFrame
+        '''
+        totals = grouped[['kills', 'wounds', 'casualties']].sum()
+        totals['occurrences'] = grouped.size()
+        return totals
+
+    def country_series(self, Country):
+        '''
+        Return the yearly series of the chosen country, same as df_ctr_all   | DataFrame
+        '''
+        return self.series.loc[[Country]].reset_index(drop=True)
+
+    def feature_matrix(self, Feature):
+        '''
+        Return the yearly series of the chosen Feature,
+        one row per country and one column per year       | DataFrame
+        '''
+        matrix = self.series.set_index('year', append=True)[Feature].unstack('year')
+        return matrix.reindex(self.countries)
+
+    def rolling_stats(self, Feature, window=None):
+        '''
+        Return the RollingStats of the chosen Feature for all the countries,
+        computed once per feature and window                              | RollingStats
+        '''
+        window = window or TREND_WINDOW
+        if (Feature, window) not in self._rolling:
+            self._rolling[(Feature, window)] = RollingStats(self.feature_matrix(Feature), window)
+        return self._rolling[(Feature, window)]
+
+    def trend_table(self, window=None):
+        '''
+        Return the trend flag of every country (rows) and feature (columns)   | DataFrame
+        '''
+        return pd.DataFrame({Feature: self.rolling_stats(Feature, window).trend_flags()
+                             for Feature in PROFILE_FEATURES}, columns=PROFILE_FEATURES)
+
+    def anomalies(self):
+        '''
+        Return the sudden spikes of the ANOMALY_METRICS of all the countries,
+        ranked by robust z-score, computed once                             | DataFrame
+        '''
+        if self._anomalies is None:
+            matrices = {metric: self.feature_matrix(metric) for metric in ANOMALY_METRICS}
+            self._anomalies = detect_anomalies(matrices, TREND_WINDOW, ANOMALY_THRESHOLD)
+        return self._anomalies
+
+    def forecasts(self, Feature):
+        '''
+        Return the HoltForecast of the chosen Feature for all the countries,
+        fitted once per feature for the next MAX_FORECAST_YEARS years       | HoltForecast
+        '''
+        if Feature not in self._forecasts:
+            self._forecasts[Feature] = HoltForecast(self.feature_matrix(Feature), MAX_FORECAST_YEARS)
+        return self._forecasts[Feature]
+
+    def country_stats(self, Country):
+        '''
+        Return the statistics of the chosen country, same as ctr_stats       | DataFrame
+        '''
+        return self.stats.loc[Country].reindex(['year'] + PROFILE_FEATURES)
+
+
+@lru_cache(maxsize=None)
+@disk_cache.persistent
+def country_profiles():
+    '''
+    Return the CountryProfiles of the whole dataset,
+    built only once per session and kept on disk until the dataset changes
+    '''
+    return CountryProfiles()
+
+
+@lru_cache(maxsize=None)
+def year_smoother():
+    '''
+    Return the SplineSmoother of the years in the GT Database,
+    its spline basis is computed only once per session
+    '''
+    return SplineSmoother(YEARS)
+
+
+@lru_cache(maxsize=1024)
+def smoothed_series(Country, Feature):
+    '''
+    Parameters
+        - Country: name of a country or "The Whole World"   | str
+        - Feature: type of damage                           | str
+    Return
+        the smooth line of the chosen Feature of the chosen country,
+        cached per country and feature                      | np.array
+    '''
+    y_smooth = year_smoother().smooth(df_ctr_all(Country)[Feature].values)
+    y_smooth.setflags(write=False)  # shared by all the callers
+    return y_smooth
+
+
+def smooth_all(Feature, profiles=None):
+    '''
+    Parameters
+        - Feature : type of damage                                   | str
+        - profiles: precomputed data, country_profiles() if None     | CountryProfiles
+    Return
+        the smooth lines of all the countries in one batch,
+        one row per country and one column per point of the line     | DataFrame
+    '''
+    if profiles is None:
+        profiles = country_profiles()
+    smoother = year_smoother()
+    matrix = profiles.feature_matrix(Feature)
+    return pd.DataFrame(smoother.smooth(matrix.values), index=matrix.index, columns=smoother.x_smooth)
+
+
+def country_trends(Country, profiles=None, window=None):
+    '''
+    Return the trend flag ('rising', 'falling' or 'stable')
+    of every feature of the chosen country                   | Series
+    '''
+    if profiles is None:
+        profiles = country_profiles()
+    return profiles.trend_table(window).loc[Country]
+
+
+def country_anomalies(Country, profiles=None):
+    '''
+    Return the sudden spikes of the chosen country,
+    ranked by robust z-score                                 | DataFrame
+    '''
+    if profiles is None:
+        profiles = country_profiles()
+    anomalies = profiles.anomalies()
+    return anomalies[anomalies.country == Country]
+
+
+def df_ctr_all(Country, profiles=None):
     '''
     Parameter
-        Country: name of a country or "The Whole World"   | str
+        Country : name of a country or "The Whole World"                | str
+        profiles: precomputed data, country_profiles() if None          | CountryProfiles
     Return
         a DataFrame (excluding 1993)
     Features
@@ -123,31 +338,33 @@ def df_ctr_all(Country):
         - number of kills, wounds and casualties
         - number of annual attack occurrences
     '''
-    df1 = df_ctr(Country).groupby('year').sum().reset_index()
-    df2 = df_occur_by_ctr_allyears(Country)
-    df_merge = pd.merge(df1, df2, on='year', how='outer').fillna(0).sort_values(by='year')
-    df = df_merge.reset_index().drop(['index'], 1)
-    return drop93(df)  # drop the data-lacking year in the original dataset
+    if profiles is None:
+        profiles = country_profiles()
+    return profiles.country_series(Country)
 
 
-def ctr_stats(Country):
+def ctr_stats(Country, profiles=None):
     '''
     Return a statistical analyzing table of
     the chosen country's attack data
     across the whole time series                 | DataFrame
     '''
-    ctr_stats = df_ctr_all(Country).describe().T
-    ctr_stats['sum'] = df_ctr_all(Country).sum()
-    return ctr_stats
+    if profiles is None:
+        profiles = country_profiles()
+    return profiles.country_stats(Country)
 
-def analy_ctr(Country):
+def analy_ctr(Country, profiles=None):
     '''
     Return a structured statistical analysis
     of the chosen country's attack data
     across the whole time series                 | String
     '''
-    desc = ctr_stats(Country)
-    df_ixby_yr = df_ctr_all(Country).set_index('year')
+    desc = ctr_stats(Country, profiles)
+    df_ixby_yr = df_ctr_all(Country, profiles).set_index('year')
+    trends = country_trends(Country, profiles)
+    spikes = country_anomalies(Country, profiles)
+    spike_years = lambda metric: ', '.join(str(year) for year in
+                                           sorted(spikes.year[spikes.metric == metric])) or 'none'
     analysis_str = '\
                       Statistical Analysis - Terrorism Attacks in {}                        \n\
                                                 * * *                                       \n\
@@ -173,12 +390,18 @@ def analy_ctr(Country):
                     3) The standard deviation:           {} \n \
                         * kills                          {} \n \
                         * wounds                         {} \n \
+               - Recent Trend ({}-year moving average)      \n \
+                        * occurrences                    {} \n \
+                        * casualties                     {} \n \
+               - Sudden Spikes (robust z-score above {})    \n \
+                        * occurrences                    {} \n \
+                        * casualties                     {} \n \
 --+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--\n'
     analysis = analysis_str.format(Country,
-                                   np.argmax(df_ixby_yr.occurrences),               # the year with maximum occurrence
+                                   df_ixby_yr.occurrences.idxmax(),                 # the year with maximum occurrence
                                    int(df_ixby_yr.occurrences.max()),               # the maximum occurrence
                                    Country,
-                                   np.argmax(df_ixby_yr.casualties),          # the year with maximum casualties
+                                   df_ixby_yr.casualties.idxmax(),            # the year with maximum casualties
                                    Country,
                                    str(int(desc.loc['casualties', 'max'])),   # the largest number of casualties
                                    str(int(desc.loc['occurrences', 'max'])),        # the largest number of occurrences
@@ -195,15 +418,107 @@ def analy_ctr(Country):
                                    str(desc.loc['casualties', 'std']),        # std of annual casualties
                                    str(desc.loc['kills', 'std']),             # std of annual kills
                                    str(desc.loc['wounds', 'std']),            # std of annual wounds
+                                   TREND_WINDOW,
+                                   trends['occurrences'],                     # trend of the attacks
+                                   trends['casualties'],                      # trend of the casualties
+                                   ANOMALY_THRESHOLD,
+                                   spike_years('occurrences'),                # years of sudden spikes in attacks
+                                   spike_years('casualties'),                 # years of sudden spikes in casualties
                                   )
     return analysis
 
-def analy_and_plot(Country, Feature, Color):
+def country_report(Country, profiles=None):
+    '''
+    Return the statistical report of the chosen country
+    as a dict of plain python values, for json files       | dict
+    '''
+    if profiles is None:
+        profiles = country_profiles()
+    series = profiles.country_series(Country)
+    stats = profiles.country_stats(Country).drop('year')
+    return {'country': Country,
+            'report': analy_ctr(Country, profiles),
+            'years': [int(year) for year in series.year],
+            'series': {feature: [float(v) for v in series[feature]] for feature in PROFILE_FEATURES},
+            'statistics': {feature: {stat: float(stats.loc[feature, stat]) for stat in STATISTICS}
+                           for feature in PROFILE_FEATURES}}
+
+def country_forecast(Country, Feature, Horizon, profiles=None):
+    '''
+    Parameters
+        - Country : name of a country or "The Whole World"          | str
+        - Feature : type of damage                                  | str
+        - Horizon : number of years to forecast                     | int
+        - profiles: precomputed data, country_profiles() if None    | CountryProfiles
+    Return
+        the point forecasts with the lower and upper bounds
+        of the 95% prediction intervals, indexed by year            | DataFrame
+    '''
+    if profiles is None:
+        profiles = country_profiles()
+    fitted = profiles.forecasts(Feature)
+    forecast = pd.DataFrame({'forecast': fitted.forecast.loc[Country],
+                             'lower': fitted.lower.loc[Country],
+                             'upper': fitted.upper.loc[Country]},
+                            columns=['forecast', 'lower', 'upper'])
+    return forecast.iloc[:Horizon]
+
+
+def draw_line_plot(Country, Feature, Color, ax, profiles=None, Horizon=0):
+    '''
+    Parameters
+        - Country : country name                                    | str
+        - Feature : type of damage                                  | str
+        - Color   : color of plot                                   | str
+        - ax      : axes to draw on                                 | matplotlib Axes
+        - profiles: precomputed data, country_profiles() if None    | CountryProfiles
+        - Horizon : number of years to forecast, none if 0          | int
+    '''
+    mean = ctr_stats(Country, profiles)['mean'].loc[Feature]
+
+    # set smooth linestyle, with the precomputed cubic spline basis of the years
+    x_smooth = year_smoother().x_smooth
+    if profiles is None:
+        y_smooth = smoothed_series(Country, Feature)
+    else:
+        y_smooth = year_smoother().smooth(df_ctr_all(Country, profiles)[Feature].values)
+
+    ax.plot(x_smooth, y_smooth, '-', color=Color, linewidth=3,
+            label='{} in {}'.format(Feature.capitalize(), Country))
+    ax.axhline(y=mean, label='Average {}'.format(Feature.capitalize()),
+               color='k', linewidth=1, linestyle='dashed')
+    # mark the years of sudden spikes
+    spikes = country_anomalies(Country, profiles)
+    spikes = spikes[spikes.metric == Feature]
+    if len(spikes):
+        ax.scatter(spikes.year, spikes.value, s=80, color='crimson', zorder=3,
+                   label='Sudden {} Spike'.format(Feature.capitalize()))
+        for year, value in zip(spikes.year, spikes.value):
+            ax.annotate(str(year), xy=(year, value), xytext=(0, 8),
+                        textcoords='offset points', ha='center', color='crimson')
+    # extend the line with the forecast of the next years
+    if Horizon > 0:
+        forecast = country_forecast(Country, Feature, Horizon, profiles)
+        last = df_ctr_all(Country, profiles).iloc[-1]
+        years = [last.year] + list(forecast.index)
+        ax.plot(years, [last[Feature]] + list(forecast.forecast), '--', color=Color, linewidth=2,
+                label='Forecast of {}'.format(Feature.capitalize()))
+        ax.fill_between(forecast.index, forecast.lower, forecast.upper, color=Color, alpha=0.2,
+                        label='95% Prediction Interval')
+    ax.set_ylim(bottom=0)
+    ax.set_title('Terror Attack {} in {} (1970-2015)'.format(Feature.capitalize(), Country), size=16)
+    ax.set_xlabel('Year', size=14)
+    ax.set_ylabel('Number of Terror {}'.format(Feature.capitalize()), size=14)
+    ax.legend()
+
+
+def analy_and_plot(Country, Feature, Color, Horizon=0):
     '''
     Parameters
         - Country: country name          | str
         - Feature: type of damage        | str
         - Color:   color of plot         | str
+        - Horizon: years to forecast     | int
     Return
         - Line Plot in smoothed fashion  | Plot
         - Statistical analysis           | String
@@ -213,30 +528,10 @@ def analy_and_plot(Country, Feature, Color):
         raise NoCountryDataError
 
     else:
-        fig = plt.figure(figsize=(15, 5))
-
-        df = df_ctr_all(Country)
-        x = df.year
-        y = df[Feature]
-        mean = ctr_stats(Country)['mean'].loc[Feature]
-
-        # set smooth linestyle
-        x = np.array(x)
-        y = np.array(y)
-        x_smooth = np.linspace(x.min(), x.max(), 500)
-        y_smooth = spline(x, y, x_smooth)  # use spline in scipy library to smooth
-
         # set the seaborn gird background as white
         sns.set(style="whitegrid")
-        plt.plot(x_smooth, y_smooth, '-', color=Color, linewidth=3,
-                 label='{} in {}'.format(Feature.capitalize(), Country))
-        plt.axhline(y=mean, label='Average {}'.format(Feature.capitalize()),
-                    color='k', linewidth=1, linestyle='dashed')
-        plt.ylim(ymin=0)
-        plt.title('Terror Attack {} in {} (1970-2015)'.format(Feature.capitalize(), Country), size=16)
-        plt.xlabel('Year', size=14)
-        plt.ylabel('Number of Terror {}'.format(Feature.capitalize()), size=14)
-        plt.legend()
+        fig = plt.figure(figsize=(15, 5))
+        draw_line_plot(Country, Feature, Color, fig.gca(), Horizon=Horizon)
         plt.show()
         print(analy_ctr(Country))
 
@@ -279,17 +574,33 @@ def feature4_picker():
                     )
 
 
+def horizon_slider():
+    '''
+    Return a number of years to forecast from users' manual pick
+    '''
+    return IntSlider(value=5,
+                     min=0,
+                     max=MAX_FORECAST_YEARS,
+                     step=1,
+                     description='Forecast:',
+                     continuous_update=False)
+
+
 def Display_Your_Analysis_And_LinePlot():
     '''
     Allow users to interactively explore data information
     and customize:
         - the lineplot
         - the Statistical Analysis
+    the rendered line plots are cached by figure_cache
     '''
+    # imported here since the figure cache renders with this module
+    import figure_cache as fc
     try:
-        interact(analy_and_plot,
+        interact(fc.analy_and_plot,
                  Country=country_picker(),
                  Feature=feature4_picker(),
-                 Color=color_picker())
+                 Color=color_picker(),
+                 Horizon=horizon_slider())
     except NoCountryDataError as x:
         print(x)
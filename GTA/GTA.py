@@ -46,3 +46,7 @@ def GTA_BC():
 
 def GTA_DOT():
     return dot.Display_Your_Dot_Plot()
+
+
+def GTA_DOT_CMP():
+    return dot.Display_Your_Dot_Plot_Comparison()
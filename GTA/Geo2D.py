@@ -2,6 +2,7 @@
 This module contains
     - functions to plot 2D geo map with Basemap
     - functions to assist the plot
+    - the coordinates of the attacks of every year, grouped once for the animations
 
 This module allows users to
     - select year interval with ipywidgets
@@ -22,22 +23,105 @@ except ImportError:
 
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import util as ut
 import data
 import re
+from functools import lru_cache
+import disk_cache
 from ipywidgets import *
 from UserError import *
 
 
-def plot_2D_density(Year, MapStyle):
+@lru_cache(maxsize=None)
+@disk_cache.persistent
+def year_coordinates():
     '''
-    Parameters
-        - Year      : between 1970-2015     | str
-        - MapStyle  : style palette         | str
+    Return the (longitudes, latitudes) of the attacks of every year,
+    grouped in one pass over the dataset                              | dict
+    '''
+    df_gt = data.load_df()
+    coordinates = {}
+    for year, df in df_gt.groupby('year'):
+        lon, lat = df.longitude.values.astype(float), df.latitude.values.astype(float)
+        lon.setflags(write=False)
+        lat.setflags(write=False)
+        coordinates[int(year)] = (lon, lat)
+    return coordinates
+
+
+def interval_coordinates(Year):
+    '''
+    Parameter
+        - Year: year interval                                   | tuple
     Return
-        A 2D Geo Map: The denser the red marker in a country,
-                      the more severe damages had taken place.
+        the (longitudes, latitudes) of the attacks in the interval,
+        from the coordinates grouped by year_coordinates        | tuple
+    '''
+    coordinates = year_coordinates()
+    years = [year for year in range(Year[0], Year[1] + 1) if year in coordinates]
+    if not years:
+        return np.array([]), np.array([])
+    return (np.concatenate([coordinates[year][0] for year in years]),
+            np.concatenate([coordinates[year][1] for year in years]))
+
+
+@lru_cache(maxsize=1)
+def mill_basemap():
+    '''
+    Return the Miller projection Basemap, built once per process
+    '''
+    return Basemap('mill')
+
+
+def draw_2D_density(lon, lat, Year, MapStyle, ax):
+    '''
+    Parameters
+        - lon, lat  : coordinates of the attacks             | np.array
+        - Year      : year interval of the attacks           | tuple
+        - MapStyle  : style palette                          | str
+        - ax        : the axes to draw on                    | Axes
+    ---
+    Draw the density map of the attacks on the axes
+    '''
+    m = mill_basemap()
+    m.drawcountries(linewidth=0.5,
+                    linestyle='solid',
+                    color='white',
+                    antialiased=1,
+                    ax=ax,
+                    zorder=None
+                    )
+
+    # Background settings
+    if MapStyle == 'Blue Marble':
+        m.drawcoastlines(ax=ax)
+        m.bluemarble(ax=ax)
+    elif MapStyle == 'Etopo':
+        m.etopo(ax=ax)
+    else:
+        m.drawcoastlines(color='w', ax=ax)
+        m.drawcountries(color='w', ax=ax)
+        m.drawstates(color='w', ax=ax)
+        m.fillcontinents(color='lightblue',lake_color='w', ax=ax)
+        m.drawmapboundary(fill_color='w', color='w', ax=ax)
+
+    x,y = m(lon, lat)
+    m.plot(x, y, 'r^', marker='o', markersize=4, alpha=.3, ax=ax)
+
+    if Year[0] == Year[1]:
+        ax.set_title('Global Attack Density Plot: {}'.format(Year[0]), size=16)
+    else:
+        ax.set_title('Global Attack Density Plot: {}-{}'.format(Year[0], Year[1]), size=16)
+
+
+def check_year_interval(Year):
+    '''
+    Parameter
+        - Year: between 1970-2015     | tuple
+    ---
+    Raise the error of an invalid year interval
     '''
     # use regular expression to check the format
     if not re.match(r'[\[|\(][0-9]{4}\,\s?[0-9]{4}[\]|\)]$', str(Year)):
@@ -47,55 +131,29 @@ def plot_2D_density(Year, MapStyle):
     elif Year[0] >= Year[1]:
         raise IntervalReverseError
 
-    # catch the missing value exceptions in 1993
-    elif Year == (1993, 1993):
-        print('Data of 1993 is not available in Global Terrorism Database.\n\
-Click the link to learn why.\nhttps://www.start.umd.edu/gtd/faq/')
-
     # catch the out of range yer interval input errors
     elif (Year[0] < 1970) or (Year[1] > 2015):
         raise IntervalLeakError
 
-    else:
-        if Year[0] == Year[1]:  # catch the excetion the starting year and the ending year converge
-            df_gt = data.load_df()
-            df = df_gt[df_gt.year == Year[0]]
-        else:
-            df = ut.df_sel_btw_years(Year)
-
-        plt.figure(figsize=(18,10), frameon=False)
-
-        m = Basemap('mill')
-        m.drawcountries(linewidth=0.5,
-                        linestyle='solid',
-                        color='white',
-                        antialiased=1,
-                        ax=None,
-                        zorder=None
-                        )
-
-        # Background settings
-        if MapStyle == 'Blue Marble':
-            m.drawcoastlines()
-            m.bluemarble()
-        elif MapStyle == 'Etopo':
-            m.etopo()
-        else:
-            m.drawcoastlines(color='w')
-            m.drawcountries(color='w')
-            m.drawstates(color='w')
-            m.fillcontinents(color='lightblue',lake_color='w')
-            m.drawmapboundary(fill_color='w', color='w')
-
-        # get latitude and longitude
-        lat = ut.make_array(df, 'latitude')
-        lon = ut.make_array(df, 'longitude')
-
-        x,y = m(lon, lat)
-        m.plot(x, y, 'r^', marker='o', markersize=4, alpha=.3)
-
-        plt.title('Global Attack Density Plot: {}-{}'.format(Year[0], Year[1]), size=16)
-        plt.show()
+
+def plot_2D_density(Year, MapStyle):
+    '''
+    Parameters
+        - Year      : between 1970-2015     | str
+        - MapStyle  : style palette         | str
+    Return
+        A 2D Geo Map: The denser the red marker in a country,
+                      the more severe damages had taken place.
+    '''
+    check_year_interval(Year)
+
+    fig = plt.figure(figsize=(18,10), frameon=False)
+
+    # get longitude and latitude
+    lon, lat = interval_coordinates(Year)
+
+    draw_2D_density(lon, lat, Year, MapStyle, fig.gca())
+    plt.show()
 
 
 def year_interval_slider():
@@ -129,9 +187,19 @@ def map_style_picker():
                     button_style='info')
 
 
-def Display_Your_Geo2D_Map():
+def Display_Your_Geo2D_Map(live=False):
     '''
     Allow users to interactively explore data information
-    and customize the 2D Geo Map
+    and customize the 2D Geo Map,
+    the rendered maps are cached by figure_cache
+    ---
+    Parameter
+        - live: debounce the widgets and render in the background, see live   | bool
     '''
-    interact(plot_2D_density, Year=year_interval_slider(), MapStyle=map_style_picker())
+    if live:
+        # imported here since the live layer renders with this module
+        import live as lv
+        return lv.Display_Your_Geo2D_Map()
+    # imported here since the figure cache renders with this module
+    import figure_cache as fc
+    interact(fc.plot_2D_density, Year=year_interval_slider(), MapStyle=map_style_picker())
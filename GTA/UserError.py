@@ -45,3 +45,12 @@ class IntervalReverseError(Exception):
 class IntervalLeakError(Exception):
     def __str__(self):
         return 'Interval bounds Leakage! Please enter a list of year interval between 1970 and 2015.\n'
+
+
+# Error: Invalid parameters of a query to the local server
+class QueryError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message + '\n'
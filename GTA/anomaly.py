@@ -0,0 +1,66 @@
+'''
+This module flags the sudden spikes of yearly series
+for all the countries at once, on country x year matrices:
+    - the baseline of a year is the median of the previous years in the window
+    - the spread is the median absolute deviation (MAD) of those years
+    - the robust z-score of the year is its distance to the baseline in MADs
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import numpy as np
+import pandas as pd
+from trends import sliding_windows
+
+
+# scales the MAD to the standard deviation of a normal distribution
+MAD_SCALE = 0.6745
+
+
+def robust_zscores(values, window=5, min_mad=1.0):
+    '''
+    Parameters
+        - values : one series per row                                  | np.array
+        - window : number of previous years in the baseline             | int
+        - min_mad: lower bound of the MAD, so that a flat baseline
+                   does not turn every small change into a spike        | float
+    Return
+        (robust z-scores, baselines) of every value,
+        NaN for the first window years which have no baseline           | tuple
+    '''
+    values = np.asarray(values, dtype=float)
+    # the windows of the previous years, the last one would only predict the future
+    previous = sliding_windows(values, window)[:, :-1, :]
+    baseline = np.median(previous, axis=2)
+    mad = np.median(np.abs(previous - baseline[:, :, np.newaxis]), axis=2)
+    scores = np.full(values.shape, np.nan)
+    baselines = np.full(values.shape, np.nan)
+    scores[:, window:] = MAD_SCALE * (values[:, window:] - baseline) / np.maximum(mad, min_mad)
+    baselines[:, window:] = baseline
+    return scores, baselines
+
+
+def detect_anomalies(matrices, window=5, threshold=3.5, min_mad=1.0):
+    '''
+    Parameters
+        - matrices : country x year DataFrame of every metric          | dict
+        - window   : number of previous years in the baseline          | int
+        - threshold: robust z-score above which a year is a spike      | float
+    Return
+        the spikes of all the countries and metrics, ranked by score,
+        with the columns country, year, metric, value, baseline, score | DataFrame
+    '''
+    tables = []
+    for metric, matrix in matrices.items():
+        scores, baselines = robust_zscores(matrix.values, window, min_mad)
+        rows, columns = np.nonzero(scores > threshold)
+        tables.append(pd.DataFrame({'country': matrix.index.values[rows],
+                                    'year': matrix.columns.values[columns],
+                                    'metric': metric,
+                                    'value': matrix.values[rows, columns],
+                                    'baseline': baselines[rows, columns],
+                                    'score': scores[rows, columns]},
+                                   columns=['country', 'year', 'metric', 'value', 'baseline', 'score']))
+    anomalies = pd.concat(tables, ignore_index=True)
+    return anomalies.sort_values('score', ascending=False).reset_index(drop=True)
@@ -0,0 +1,473 @@
+'''
+This module renders the visualizations in batch, without a notebook:
+    - choropleth maps of every year, feature and color palette as standalone html files
+    - heatmaps of every region and feature as image files
+    - statistical reports (and line plots) of every country as text, html or json files
+    - animated GIF/MP4 time-lapses of the bubble chart (by 5-year period)
+      and the density map (by year)
+
+The dataset is loaded once and shared with a pool of worker processes,
+the time spent on every output is reported. The workers are forked where the platform
+allows it, so they inherit the imported modules and the loaded data; with spawn
+(Windows) every worker imports this module again, which is why bubble_chart,
+loading its data on import, is only imported by the animations.
+The data of the animations is kept on disk by disk_cache, and their frames are cached
+as png files keyed by the content of the dataset file and the version of the code,
+so a re-export after a style change only renders the frames again.
+
+Usage (from the GTA directory):
+    python batch.py choropleth --out choropleth_maps --workers 4
+    python batch.py heatmap --out heatmaps --format png
+    python batch.py reports --out reports --formats txt json --plot casualties
+    python batch.py animate bubble density --out animations --formats gif mp4 --fps 2
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import os
+import re
+import sys
+import html
+import json
+import time
+import argparse
+from multiprocessing import get_context, cpu_count
+
+# render without a display, before pyplot is imported by the modules below
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.animation import FFMpegWriter
+
+# Exception handling if not successfully loading Pillow, only needed for the GIF animations
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+import seaborn as sns
+import AnalysisAndLinePlot as al
+import disk_cache
+import choropleth as cr
+import Geo2D as geo
+import geo_simplify as gs
+import heatmap as ht
+
+
+# figure size (inches) and resolution of the animation frames,
+# every frame has the same even number of pixels as the MP4 encoder requires
+ANIMATION_FIGSIZE = {'bubble': (16, 9), 'density': (18, 10)}
+ANIMATION_DPI = 80
+
+
+# data shared with the worker processes, set once by the pool initializer
+_shared = {}
+
+# fork the workers where available, the default start method spawns them on macOS and Windows,
+# importing the modules and loading the dataset again in every worker
+try:
+    _context = get_context('fork')
+except ValueError:
+    _context = get_context()
+
+
+def _init_worker(state):
+    '''
+    Pool initializer: keep the preloaded data in the worker process
+    '''
+    _shared.update(state)
+
+
+def run_in_pool(worker, jobs, state, workers=None, report=print, chunksize=1):
+    '''
+    Parameters
+        - worker    : function of one job, returning (output path, seconds)  | function
+        - jobs      : arguments of the worker                                | list
+        - state     : preloaded data shared with the workers                 | dict
+        - workers   : number of processes, the number of CPUs if None        | int
+        - report    : function printing the progress                         | function
+        - chunksize : number of jobs sent to a worker at once                | int
+    Return
+        (output path, seconds) of every job, in the order of completion    | list
+    '''
+    workers = workers or cpu_count()
+    start = time.time()
+    timings = []
+    with _context.Pool(workers, initializer=_init_worker, initargs=(state,)) as pool:
+        for path, seconds in pool.imap_unordered(worker, jobs, chunksize):
+            timings.append((path, seconds))
+            report('{:<60} {:6.2f}s'.format(path, seconds))
+    total = time.time() - start
+    if timings:
+        report('{} files in {:.2f}s with {} workers ({:.1f} files/s, slowest {:.2f}s)'.format(
+            len(timings), total, workers, len(timings) / total, max(s for _, s in timings)))
+    return timings
+
+
+def _export_choropleth(job):
+    '''
+    Worker: save one choropleth map as a standalone html file
+    '''
+    Year, Feature, Color, path = job
+    start = time.time()
+    map = cr.make_choropleth_map(Color, Feature, Year,
+                                 matrix=_shared['matrix'], geo_str=_shared['geo_str'])
+    map.save(path)
+    return path, time.time() - start
+
+
+def choropleth_jobs(out_dir, years, features, palettes):
+    '''
+    Return the (year, feature, palette, output path) of every map,
+    the year 1993 is skipped since there is no data in the GT Database   | list
+    '''
+    jobs = []
+    for Year in range(years[0], years[1] + 1):
+        if Year == 1993:
+            continue
+        for Feature in features:
+            for Color in palettes:
+                path = os.path.join(out_dir, 'choropleth_{}_{}_{}.html'.format(Year, Feature, Color))
+                jobs.append((Year, Feature, Color, path))
+    return jobs
+
+
+def export_choropleths(out_dir='choropleth_maps', years=(1970, 2015),
+                       features=None, palettes=None, workers=None, report=print):
+    '''
+    Parameters
+        - out_dir  : directory of the html files                     | str
+        - years    : first and last year                             | tuple
+        - features : features to plot, all of feature3 if None       | list
+        - palettes : color palettes, all of the picker's if None     | list
+        - workers  : number of processes                             | int
+    Return
+        (output path, seconds) of every map                          | list
+    '''
+    features = features or list(ht.feature3_options.values())
+    palettes = palettes or list(cr.palette_options.values())
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with open(gs.geo_path_for_zoom(cr.ZOOM_START)) as geo_file:
+        geo_str = geo_file.read()
+    state = {'matrix': cr.choropleth_matrix(), 'geo_str': geo_str}
+    jobs = choropleth_jobs(out_dir, years, features, palettes)
+    return run_in_pool(_export_choropleth, jobs, state, workers, report)
+
+
+def slugify(name):
+    '''
+    Return the name usable in a file name, e.g. 'Australasia_Oceania'   | str
+    '''
+    return re.sub(r'[^0-9A-Za-z]+', '_', name).strip('_')
+
+
+def _export_heatmap(job):
+    '''
+    Worker: save the heatmap of one region and feature as an image file
+    '''
+    Region, Feature, Cmap, height, fast, path = job
+    start = time.time()
+    fig = plt.figure(figsize=(25, height))
+    ht.draw_heatmap(_shared['pivots'][(Region, Feature)], Feature, Region, Cmap, fig.gca(), fast)
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return path, time.time() - start
+
+
+def heatmap_jobs(out_dir, pivots, heights, cmaps, fmt='png'):
+    '''
+    Parameters
+        - pivots  : pivot table of every (region, feature)    | dict
+        - heights : figure height of every region             | dict
+    Return
+        the (region, feature, cmap, height, fast, output path) of every heatmap,
+        the largest first so the slowest heatmaps do not start last   | list
+    '''
+    jobs = []
+    for (Region, Feature), pivot_table in sorted(pivots.items(), key=lambda item: -item[1].size):
+        fast = ht.use_fast_heatmap(pivot_table)
+        for Cmap in cmaps:
+            path = os.path.join(out_dir, 'heatmap_{}_{}_{}.{}'.format(slugify(Region), Feature, Cmap, fmt))
+            jobs.append((Region, Feature, Cmap, heights[Region], fast, path))
+    return jobs
+
+
+def export_heatmaps(out_dir='heatmaps', regions=None, features=None, cmaps=None,
+                    fmt='png', workers=None, report=print):
+    '''
+    Parameters
+        - out_dir  : directory of the image files                     | str
+        - regions  : regions to plot, all of them if None             | list
+        - features : features to plot, all of feature3 if None       | list
+        - cmaps    : color maps, the classic 'RdBu_r' if None         | list
+        - fmt      : image format, e.g. 'png' or 'svg'                | str
+        - workers  : number of processes                              | int
+    Return
+        (output path, seconds) of every heatmap                       | list
+    '''
+    regions = regions or ht.load_gta().region_names
+    features = features or list(ht.feature3_options.values())
+    cmaps = cmaps or ['RdBu_r']
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    # the workers only get the pivot tables, not the whole dataset
+    pivots = {(Region, Feature): ht.region_pivot(Region, Feature)
+              for Region in regions for Feature in features}
+    heights = {Region: ht.heatmap_height(Region, ht.use_fast_heatmap(pivots[(Region, features[0])]))
+               for Region in regions}
+    jobs = heatmap_jobs(out_dir, pivots, heights, cmaps, fmt)
+    return run_in_pool(_export_heatmap, jobs, {'pivots': pivots}, workers, report)
+
+
+def report_html(report, image=None):
+    '''
+    Return the statistical report as an html page, with the line plot if given   | str
+    '''
+    stats = '<table>\n<tr><th></th>{}</tr>\n{}</table>'.format(
+        ''.join('<th>{}</th>'.format(stat) for stat in al.STATISTICS),
+        ''.join('<tr><th>{}</th>{}</tr>\n'.format(feature, ''.join(
+            '<td>{:.2f}</td>'.format(report['statistics'][feature][stat]) for stat in al.STATISTICS))
+            for feature in al.PROFILE_FEATURES))
+    img = '<img src="{}">\n'.format(html.escape(image)) if image else ''
+    return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{0}</title></head>\n'
+            '<body><h1>Terrorism Attacks in {0}</h1>\n{1}{2}\n<pre>{3}</pre></body></html>\n').format(
+                html.escape(report['country']), img, stats, html.escape(report['report']))
+
+
+def _export_report(job):
+    '''
+    Worker: save the statistical report of one country in the chosen formats,
+    with its line plot if a feature is given
+    '''
+    Country, formats, Feature, Color, out_dir = job
+    start = time.time()
+    profiles = _shared['profiles']
+    base = os.path.join(out_dir, 'report_{}'.format(slugify(Country)))
+    report = al.country_report(Country, profiles)
+
+    image = None
+    if Feature:
+        image = base + '.png'
+        sns.set(style="whitegrid")
+        fig = plt.figure(figsize=(15, 5))
+        al.draw_line_plot(Country, Feature, Color, fig.gca(), profiles)
+        fig.savefig(image, bbox_inches='tight')
+        plt.close(fig)
+
+    if 'txt' in formats:
+        with open(base + '.txt', 'w') as txt_file:
+            txt_file.write(report['report'])
+    if 'json' in formats:
+        with open(base + '.json', 'w') as json_file:
+            json.dump(report, json_file, indent=1)
+    if 'html' in formats:
+        with open(base + '.html', 'w') as html_file:
+            html_file.write(report_html(report, image and os.path.basename(image)))
+    return base, time.time() - start
+
+
+def export_reports(out_dir='reports', countries=None, formats=('txt',), Feature=None,
+                   Color='#5BC0DE', workers=None, report=print):
+    '''
+    Parameters
+        - out_dir   : directory of the reports                               | str
+        - countries : countries to report, all of gtd_country_names if None  | list
+        - formats   : any of 'txt', 'html' and 'json'                        | tuple
+        - Feature   : feature of the line plots, no plot if None             | str
+        - Color     : color of the line plots                                | str
+        - workers   : number of processes                                    | int
+    Return
+        (output path without extension, seconds) of every country            | list
+    '''
+    profiles = al.country_profiles()
+    countries = countries or al.gtd_country_names(profiles)
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    jobs = [(Country, tuple(formats), Feature, Color, out_dir) for Country in countries]
+    return run_in_pool(_export_report, jobs, {'profiles': profiles}, workers, report, chunksize=8)
+
+
+def animation_data(chart):
+    '''
+    Return the precomputed data of the animation:
+    the bubble chart frames of every period, or the coordinates of the attacks of every year   | dict
+    '''
+    if chart == 'bubble':
+        import bubble_chart as bc
+        return bc.bubble_chart_frames()
+    return dict(geo.year_coordinates())
+
+
+def _render_frame(job):
+    '''
+    Worker: save one frame of an animation as a png file
+    '''
+    chart, key, MapStyle, path = job
+    start = time.time()
+    fig = plt.figure(figsize=ANIMATION_FIGSIZE[chart], dpi=ANIMATION_DPI)
+    if chart == 'bubble':
+        import bubble_chart as bc
+        chart_data = bc.bubble_chart
+        chart_data.use_frames(_shared['bubble'], 'occurrences', 'casualties')
+        ax = fig.add_subplot(1, 1, 1)
+        chart_data.draw_frame(chart_data.get_frame(key), ax)
+    else:
+        lon, lat = _shared['density'][key]
+        geo.draw_2D_density(lon, lat, (key, key), MapStyle, fig.gca())
+    fig.savefig(path, dpi=ANIMATION_DPI)
+    plt.close(fig)
+    return path, time.time() - start
+
+
+def animation_jobs(chart, keys, MapStyle, version, cache_dir):
+    '''
+    Return the (chart, frame key, map style, png path) of every frame,
+    the png files are named after everything that changes their content,
+    version being the versions of the dataset and the code               | list
+    '''
+    style = MapStyle if chart == 'density' else None
+    return [(chart, key, MapStyle,
+             os.path.join(cache_dir, '{}_frame_{}.png'.format(
+                 chart, disk_cache.digest((chart, key, style, ANIMATION_FIGSIZE[chart], ANIMATION_DPI, version)))))
+            for key in keys]
+
+
+def stitch_gif(frame_paths, path, fps):
+    '''
+    Save the frames as an animated GIF, looping forever
+    '''
+    images = [Image.open(frame_path).convert('RGB') for frame_path in frame_paths]
+    images[0].save(path, save_all=True, append_images=images[1:],
+                   duration=int(1000 / fps), loop=0)
+
+
+def stitch_mp4(frame_paths, path, fps):
+    '''
+    Save the frames as an MP4 video with ffmpeg
+    '''
+    first = plt.imread(frame_paths[0])
+    height, width = first.shape[:2]
+    fig = plt.figure(figsize=(width / ANIMATION_DPI, height / ANIMATION_DPI), dpi=ANIMATION_DPI)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+    image = ax.imshow(first)
+    writer = FFMpegWriter(fps=fps)
+    with writer.saving(fig, path, ANIMATION_DPI):
+        for frame_path in frame_paths:
+            image.set_data(plt.imread(frame_path))
+            writer.grab_frame()
+    plt.close(fig)
+
+
+def export_animation(chart, out_dir='animations', formats=('gif',), fps=2, MapStyle='Plain',
+                     years=(1970, 2015), cache_dir=None, workers=None, report=print):
+    '''
+    Parameters
+        - chart     : 'bubble' (by 5-year period) or 'density' (by year)         | str
+        - out_dir   : directory of the animations                                | str
+        - formats   : any of 'gif' and 'mp4'                                     | tuple
+        - fps       : frames per second                                          | float
+        - MapStyle  : style palette of the density map                           | str
+        - years     : first and last year of the density map                     | tuple
+        - cache_dir : directory of the cached frames,
+                      '.frame_cache' in out_dir if None                          | str
+        - workers   : number of processes                                        | int
+    Return
+        the paths of the saved animations                                        | list
+    '''
+    cache_dir = cache_dir or os.path.join(out_dir, '.frame_cache')
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    chart_data = animation_data(chart)
+    if chart == 'bubble':
+        keys = sorted(chart_data)
+        name = 'bubble_chart'
+    else:
+        keys = [year for year in sorted(chart_data) if years[0] <= year <= years[1]]
+        name = 'density_{}'.format(slugify(MapStyle))
+
+    version = (disk_cache.dataset_fingerprint(), disk_cache.code_version())
+    jobs = animation_jobs(chart, keys, MapStyle, version, cache_dir)
+    pending = [job for job in jobs if not os.path.exists(job[-1])]
+    report('{}: {} frames, {} reused from the cache'.format(name, len(jobs), len(jobs) - len(pending)))
+    if pending:
+        run_in_pool(_render_frame, pending, {chart: chart_data}, workers, report)
+
+    frame_paths = [job[-1] for job in jobs]
+    saved = []
+    for fmt in formats:
+        path = os.path.join(out_dir, '{}.{}'.format(name, fmt))
+        if fmt == 'gif' and Image is None:
+            report('Pillow is not installed, {} is skipped.'.format(path))
+            continue
+        if fmt == 'mp4' and not FFMpegWriter.isAvailable():
+            report('ffmpeg is not installed, {} is skipped.'.format(path))
+            continue
+        start = time.time()
+        (stitch_gif if fmt == 'gif' else stitch_mp4)(frame_paths, path, fps)
+        report('{:<60} {:6.2f}s'.format(path, time.time() - start))
+        saved.append(path)
+    return saved
+
+
+def parse_args(argv):
+    '''
+    Return the parsed command line arguments
+    '''
+    parser = argparse.ArgumentParser(description='Render the Global Terrorism Analysis visualizations in batch.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    choropleth = commands.add_parser('choropleth', help='choropleth maps as html files')
+    choropleth.add_argument('--out', default='choropleth_maps', help='output directory')
+    choropleth.add_argument('--years', type=int, nargs=2, default=[1970, 2015], metavar=('FIRST', 'LAST'))
+    choropleth.add_argument('--features', nargs='+', choices=cr.FEATURES, default=None)
+    choropleth.add_argument('--palettes', nargs='+', default=None)
+
+    heatmap = commands.add_parser('heatmap', help='region heatmaps as image files')
+    heatmap.add_argument('--out', default='heatmaps', help='output directory')
+    heatmap.add_argument('--regions', nargs='+', default=None)
+    heatmap.add_argument('--features', nargs='+', choices=list(ht.feature3_options.values()), default=None)
+    heatmap.add_argument('--cmaps', nargs='+', default=None)
+    heatmap.add_argument('--format', default='png', choices=['png', 'svg', 'pdf'])
+
+    reports = commands.add_parser('reports', help='statistical reports of every country')
+    reports.add_argument('--out', default='reports', help='output directory')
+    reports.add_argument('--countries', nargs='+', default=None)
+    reports.add_argument('--formats', nargs='+', choices=['txt', 'html', 'json'], default=['txt'])
+    reports.add_argument('--plot', choices=al.PROFILE_FEATURES, default=None,
+                         help='also save the line plot of this feature')
+    reports.add_argument('--color', default='#5BC0DE', help='color of the line plots')
+
+    animate = commands.add_parser('animate', help='bubble chart and density map time-lapses as GIF/MP4')
+    animate.add_argument('charts', nargs='+', choices=sorted(ANIMATION_FIGSIZE))
+    animate.add_argument('--out', default='animations', help='output directory')
+    animate.add_argument('--formats', nargs='+', choices=['gif', 'mp4'], default=['gif'])
+    animate.add_argument('--fps', type=float, default=2, help='frames per second')
+    animate.add_argument('--style', default='Plain', choices=['Blue Marble', 'Etopo', 'Plain'],
+                         help='map style of the density map')
+    animate.add_argument('--years', type=int, nargs=2, default=[1970, 2015], metavar=('FIRST', 'LAST'))
+    animate.add_argument('--cache', default=None, help='cache directory (default: OUT/.frame_cache)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.command == 'choropleth':
+        export_choropleths(args.out, tuple(args.years), args.features, args.palettes, args.workers)
+    elif args.command == 'heatmap':
+        export_heatmaps(args.out, args.regions, args.features, args.cmaps, args.format, args.workers)
+    elif args.command == 'reports':
+        export_reports(args.out, args.countries, args.formats, args.plot, args.color, args.workers)
+    elif args.command == 'animate':
+        for chart in args.charts:
+            export_animation(chart, args.out, args.formats, args.fps, args.style,
+                             tuple(args.years), args.cache, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,8 @@ This module:
 1) Prepares a dataset to be turned into a bubble chart: selects features, creates ranges from numeric features
 2) Aggregates and reshapes the data within the Bubble_Chart_Data class. This class is intended to be flexible so that
 programmers can easily adapt it to reconfigure new bubble charts or use these techniques on different data.
+The frames of every user filter value (e.g. every 5-year period) are computed once and stored read-only,
+so moving the slider only redraws.
 3) Plot the bubble chart with appropriate legends, titles, and formatting.
 4) Creates a function that allows users to scroll through the bubble chart over time.
 
@@ -20,9 +22,11 @@ import matplotlib.pyplot as plt
 import math
 import matplotlib.patches as mpatches
 import util
+import disk_cache
+from collections import namedtuple
 from matplotlib import cm
 
-Global_terrorism_analysis = ht.GTA()
+Global_terrorism_analysis = ht.load_gta()
 bubble_chart_features = ['year', 'country', 'region', 'casualties']
 gtd_bubble = Global_terrorism_analysis.gt_df[bubble_chart_features]
 gtd_bubble = util.replace_series_with_range(gtd_bubble, gtd_bubble['year'], 5)
@@ -38,6 +42,22 @@ def draw_legend(colors_legend):
         recs.append(mpatches.Rectangle((0,0),1,1,fc=colors_legend[key], alpha = 0.5))
     plt.legend(recs,list(colors_legend.keys()),loc=4)
 
+# everything needed to draw the bubble chart of one user filter value, arrays are read-only
+Bubble_Frame = namedtuple('Bubble_Frame', ['key', 'bubble_ids', 'x', 'y', 'sizes', 'colors',
+                                           'labels', 'label_x', 'label_y', 'label_offsets',
+                                           'legend', 'x_limit', 'y_limit'])
+
+def label_offsets(sizes):
+    '''Returns the (x, y) offsets in points of the labels of bubbles of the given sizes'''
+    root = np.sqrt(np.asarray(sizes, dtype=float))
+    return np.column_stack((root/4, -root/25))
+
+def read_only(array):
+    '''Returns a read-only numpy array'''
+    array = np.array(array)
+    array.setflags(write=False)
+    return array
+
 class Bubble_Chart_Data():
     def __init__(self, data, bubble_id, color, user_filter, values):
         '''Defines attributes of the bubble chart'''
@@ -51,6 +71,10 @@ class Bubble_Chart_Data():
         self.subgroups = util.group_by_columns(self.data, [self.bubble_id, self.color, self.user_filter], self.values)
         self.x_values = values
         self.y_values = values
+        self.frames = None
+        # function returning the frames, e.g. from a cache, precompute_frames if None
+        self.frames_loader = None
+        self.color_table = self.make_color_table()
 
     def count_by_subgroup(self):
         '''Uses group from init function to create a count'''
@@ -84,13 +108,25 @@ class Bubble_Chart_Data():
         '''Stores the column name corresponding to the bubbles' values on the y-axis'''
         self.y_values = y_values
 
-    def add_color_dict(self):
-        '''Creates a dictionary that maps the color variable to numbers, should be called after aggregate'''
+    def make_color_table(self):
+        '''Creates the table of the color variable: a number between 0 and 1 and the viridis color of every value'''
         #Used this resource: http://stackoverflow.com/questions/14885895/color-by-column-values-in-matplotlib
         color_cats = self.data[self.color].unique()
         colors = np.linspace(0, 1, len(color_cats))
-        colordict = dict(zip(color_cats, colors))
-        self.new_data['color'] = self.new_data[self.color].apply(lambda x: colordict[x])
+        return pd.DataFrame({'color': colors, 'rgba': list(map(tuple, cm.viridis(colors)))},
+                            index=color_cats, columns=['color', 'rgba'])
+
+    def color_values(self, categories):
+        '''Maps values of the color variable to numbers with one array index on their categorical codes'''
+        codes = pd.Categorical(categories, categories=self.color_table.index).codes
+        # values missing from the color table get the code -1, which would pick the last color
+        if (codes < 0).any():
+            raise KeyError(list(pd.unique(np.asarray(categories)[codes < 0])))
+        return self.color_table['color'].values[codes]
+
+    def add_color_dict(self):
+        '''Maps the color variable to numbers in a new column 'color', should be called after aggregate'''
+        self.new_data['color'] = self.color_values(self.new_data[self.color])
 
     def process_bubble_chart_data(self, x_values, y_values):
         '''Prepares bubble chart to be plotted'''
@@ -107,28 +143,23 @@ class Bubble_Chart_Data():
 
     def create_legend(self):
         '''Takes an object from the bubble chart data class and creates an appropriate legend. Must be called after process data'''
-        grouped_by_color = util.group_by_columns(self.new_data, [self.color, 'color'], self.bubble_id)
-        counted_by_color = util.count_by_groups(grouped_by_color)
-        counted_by_color.reset_index(inplace=True)
-
-        colors_legend = {}
-
-        for i in range(0, len(counted_by_color)):
-            colors_legend[counted_by_color[self.color][i]] = cm.viridis(counted_by_color['color'][i])
-
-        return colors_legend
-
-    def annotate(self):
-        '''Labels the top 10 bubbles by the attribute that will be on the y-axis'''
-        self.new_data.sort_values(self.y_values, ascending=False).iloc[0:20]
-        for i in range(0, 10):
-
-            offset_x = math.sqrt(self.new_data[self.bubble_size].iloc[i])/4
-            offset_y = - math.sqrt(self.new_data[self.bubble_size].iloc[i])/25
-
-            plt.annotate(self.new_data[self.bubble_id].iloc[i],
-                         xy = (self.new_data[self.x_values].iloc[i], self.new_data[self.y_values].iloc[i]),
-                         xytext=(offset_x, offset_y),
+        table = self.color_table.loc[np.unique(self.new_data[self.color].values)]
+        return dict(zip(table.index, table['rgba']))
+
+    def top_k(self, k=10):
+        '''Returns the names, x values, y values and label offsets of the top k bubbles by the attribute on the y-axis'''
+        top = np.argsort(-self.new_data[self.y_values].values, kind='mergesort')[:k]
+        return (self.new_data[self.bubble_id].values[top],
+                self.new_data[self.x_values].values[top],
+                self.new_data[self.y_values].values[top],
+                label_offsets(self.new_data[self.bubble_size].values[top]))
+
+    def annotate(self, k=10):
+        '''Labels the top k bubbles by the attribute that will be on the y-axis'''
+        for label, x, y, offset in zip(*self.top_k(k)):
+            plt.annotate(label,
+                         xy = (x, y),
+                         xytext=tuple(offset),
                          textcoords='offset points',
                          color='darkslategrey')
 
@@ -146,30 +177,93 @@ class Bubble_Chart_Data():
         ax.set_xlabel(str.title(self.x_values))
         ax.set_ylabel(str.title(self.y_values))
 
+    def precompute_frames(self, x_values='occurrences', y_values='casualties', n_labels=10):
+        '''Computes the frame of every user filter value in one grouped pass, without changing new_data.
+        The bubbles are sorted by the attribute on the y-axis, the top n_labels of them are labelled'''
+        self.set_x_axis_values(x_values)
+        self.set_y_axis_values(y_values)
+        self.bubble_size = 'all-time occurrences'
+
+        data = self.data[[self.bubble_id, self.color, self.user_filter, self.values]].dropna(
+            subset=[self.bubble_id, self.color, self.user_filter])
+        data = data.assign(**{self.user_filter: data[self.user_filter].astype(str),
+                              self.values: data[self.values].fillna(0)})
+        grouped = data.groupby([self.user_filter, self.bubble_id, self.color])[self.values]
+        bubbles = pd.concat([grouped.count(), grouped.sum()], axis=1, keys=['occurrences', self.values])
+        bubbles = bubbles.reset_index()
+        bubbles['all-time occurrences'] = data.groupby(self.bubble_id).size().reindex(bubbles[self.bubble_id]).values
+
+        bubbles['color'] = self.color_values(bubbles[self.color])
+        bubbles = bubbles.sort_values([self.user_filter, self.y_values], ascending=[True, False])
+
+        self.frames = {}
+        for key, frame in bubbles.groupby(self.user_filter, sort=False):
+            sizes = frame['all-time occurrences'].values
+            top = slice(0, n_labels)
+            legend = self.color_table.loc[np.unique(frame[self.color].values)]
+            self.frames[key] = Bubble_Frame(
+                key=key,
+                bubble_ids=read_only(frame[self.bubble_id].values),
+                x=read_only(frame[self.x_values].values),
+                y=read_only(frame[self.y_values].values),
+                sizes=read_only(sizes),
+                colors=read_only(frame['color'].values),
+                labels=read_only(frame[self.bubble_id].values[top]),
+                label_x=read_only(frame[self.x_values].values[top]),
+                label_y=read_only(frame[self.y_values].values[top]),
+                label_offsets=read_only(label_offsets(sizes[top])),
+                legend=tuple(zip(legend.index, legend['rgba'])),
+                x_limit=math.ceil(frame[self.x_values].max()/750)*750,
+                y_limit=math.ceil(frame[self.y_values].max()/7500)*7500)
+        return self.frames
+
+    def use_frames(self, frames, x_values='occurrences', y_values='casualties'):
+        '''Uses frames precomputed elsewhere, e.g. loaded from a cache, with the attributes on the axes they were built with'''
+        self.set_x_axis_values(x_values)
+        self.set_y_axis_values(y_values)
+        self.frames = frames
+
+    def get_frame(self, user_input):
+        '''Returns the precomputed frame of a user filter value, loading all the frames with frames_loader, or computing them, on first use'''
+        if self.frames is None:
+            if self.frames_loader is None:
+                self.precompute_frames()
+            else:
+                self.use_frames(self.frames_loader())
+        return self.frames[user_input]
+
+    def draw_frame(self, frame, ax):
+        '''Draws a precomputed frame on the axes'''
+        self.format_labels(ax)
+
+        ax.scatter(frame.x, frame.y, frame.sizes/5,
+                   c = frame.colors,
+                   cmap = 'viridis',
+                   vmin = 0, vmax = 1,
+                   alpha = 0.5)
+
+        for label, x, y, offset in zip(frame.labels, frame.label_x, frame.label_y, frame.label_offsets):
+            ax.annotate(label,
+                        xy = (x, y),
+                        xytext=tuple(offset),
+                        textcoords='offset points',
+                        color='darkslategrey')
+
+        recs = [mpatches.Rectangle((0,0),1,1,fc=color, alpha = 0.5) for _, color in frame.legend]
+        ax.legend(recs, [name for name, _ in frame.legend], loc=4)
+
+        ax.set_xlim(xmin = -0.05*frame.x_limit, xmax = frame.x_limit)
+        ax.set_ylim(ymin = -0.05*frame.y_limit, ymax = frame.y_limit)
+
     def create_bubble_chart(self, year):
         '''Draws the bubble chart'''
-        self.process_bubble_chart_data('occurrences', 'casualties')
-        self.filter_for_user(construct_interval(year))
-        self.new_data = self.new_data.sort_values(self.values, ascending=False)
+        frame = self.get_frame(construct_interval(year))
 
         fig = plt.figure()
         ax = fig.add_subplot(1,1,1, axisbg='white')
 
-        self.format_labels(ax)
-
-        ax.scatter(self.new_data[self.x_values],
-                         self.new_data[self.y_values],
-                         self.new_data[self.bubble_size]/5,
-                         c = self.new_data['color'],
-                         cmap = 'viridis',
-                         alpha = 0.5)
-
-        self.new_data.sort_values(self.y_values, ascending=False).iloc[0:20]
-        self.annotate()
+        self.draw_frame(frame, ax)
 
-        draw_legend(self.create_legend())
-
-        self.format_axes_length(ax)
         fig = plt.gcf()
         fig.set_size_inches(18.5, 10.5)
 
@@ -177,9 +271,20 @@ class Bubble_Chart_Data():
 
 bubble_chart = Bubble_Chart_Data(gtd_bubble, 'country', 'region', 'year ranges', 'casualties')
 
+@disk_cache.persistent
+def bubble_chart_frames():
+    '''Returns the frames of the bubble chart, kept on disk until the dataset changes'''
+    return bubble_chart.precompute_frames('occurrences', 'casualties')
+
+# the frames are loaded on first use, not when the module is imported
+bubble_chart.frames_loader = bubble_chart_frames
+
 def Display_Your_Bubble_Chart():
     '''
     Allow users to interactively explore data information
-    and customize the bubble chart
+    and customize the bubble chart,
+    the rendered bubble charts are cached by figure_cache
     '''
-    interact(bubble_chart.create_bubble_chart, year=IntSlider(min=1975,max=2015,step=5,value=1995, width = '90%', description =  'End 5yr Range'))
\ No newline at end of file
+    # imported here since the figure cache renders with this module
+    import figure_cache as fc
+    interact(fc.create_bubble_chart, year=IntSlider(min=1975,max=2015,step=5,value=1995, width = '90%', description =  'End 5yr Range'))
\ No newline at end of file
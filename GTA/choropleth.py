@@ -1,6 +1,7 @@
 '''
 This module contains
     - Choropleth class, with attributes and methods
+    - ChoroplethMatrix class, with the data of every year and feature precomputed
     - functions to process data in json file
     - functions to plot Choropleth map
     - functions to assist the plot
@@ -20,8 +21,11 @@ Project co-author: Caroline Roper (cer446)
 import pandas as pd
 import numpy as np
 import folium
+from functools import lru_cache
+import disk_cache
 import data
 import heatmap as ht
+import geo_simplify as gs
 from ipywidgets import IntSlider, Dropdown, interact
 from UserError import *
 
@@ -82,6 +86,70 @@ class Choropleth(object):
         return new_df
 
 
+# features which can be plotted on the choropleth map
+FEATURES = ['occurrences', 'kills', 'wounds', 'casualties']
+
+
+class ChoroplethMatrix(object):
+    '''
+    Attributes:
+        - self.countries: country names in the geo json file, sorted
+        - self.matrices:  year x country DataFrame of every feature,
+                          "-99" if there was no attack in the country in that year
+        - self.maxima:    year x feature DataFrame of the maximum value among all countries
+    Method:
+        - get the chosen feature in the chosen year in all countries of the map
+        - get the scale upper bound
+    ---
+    All the features are grouped by year and country in one pass,
+    so rendering a map only needs one row lookup.
+    '''
+    def __init__(self, df=None):
+        if df is None:
+            df = data.load_df()
+        df = df.fillna(0)
+        self.countries = np.sort(find_js_country_names())
+        grouped = df.groupby(['year', 'country'])
+        totals = grouped[['kills', 'wounds', 'casualties']].sum()
+        totals['occurrences'] = grouped.size()
+        # the maxima include the countries missing from the geo json file,
+        # consistently with Choropleth.max_dam
+        self.maxima = totals.groupby(level='year').max()
+        self.matrices = {}
+        for feature in FEATURES:
+            matrix = totals[feature].unstack('country').reindex(columns=self.countries)
+            self.matrices[feature] = matrix.fillna(-99)
+
+    def year_data(self, Year, Feature):
+        '''
+        Return the chosen Feature of all the countries in the geo json file
+        in the chosen year, same as Choropleth.all_ctr_dam        | DataFrame
+        '''
+        matrix = self.matrices[Feature]
+        if Year in matrix.index:
+            values = matrix.loc[Year].values
+        else:
+            values = np.full(len(self.countries), -99.0)
+        return pd.DataFrame({'country': self.countries, Feature: values},
+                            columns=['country', Feature])
+
+    def scale_max(self, Year, Feature):
+        '''
+        Return the upper bound of the chosen feature for plotting
+        '''
+        return (int(self.maxima.loc[Year, Feature] / 100) + 1) * 100
+
+
+@lru_cache(maxsize=None)
+@disk_cache.persistent
+def choropleth_matrix():
+    '''
+    Return the ChoroplethMatrix of the whole dataset,
+    built only once per session and kept on disk until the dataset changes
+    '''
+    return ChoroplethMatrix()
+
+
 def find_js_country_names():
     '''
     load the geo json file
@@ -102,6 +170,61 @@ def js_country_names():
     return js_ctr
 
 
+# zoom level of the map when it is opened
+ZOOM_START = 2
+
+
+def make_choropleth_map(Color, Feature, Year, matrix=None, geo_str=None):
+    '''
+    Parameters
+        - Color     : color palette                                 | str
+        - Feature   : feature of damages                            | str
+        - Year      : between 1970-2015, except 1993                | int
+        - matrix    : precomputed data, choropleth_matrix() if None | ChoroplethMatrix
+        - geo_str   : content of the geo json file to embed,
+                      the file suiting ZOOM_START if None           | str
+    Return
+        A Choropleth Map, without checking the year
+    ---
+    The map embeds a single geometry, chosen for ZOOM_START: the low resolution one
+    once geo_simplify.save_simplified_geojson() has been run. It is not switched
+    when the user zooms in, so the borders stay coarse at high zoom levels;
+    pass the geo_str of a finer level to draw a map meant to be zoomed in.
+    '''
+    if matrix is None:
+        matrix = choropleth_matrix()
+    gtd_data = matrix.year_data(Year, Feature)
+    # The upper bound of scale bar
+    up = matrix.scale_max(Year, Feature)
+    # Set the map base
+    map = folium.Map(location=[32, -90],
+                     zoom_start=ZOOM_START,
+                     min_zoom=2,
+                     tiles='Mapbox bright')
+    if geo_str is None:
+        # embed the simplified geometry suiting the starting zoom level only,
+        # generated by geo_simplify.save_simplified_geojson()
+        geo_source = {'geo_path': gs.geo_path_for_zoom(ZOOM_START)}
+    else:
+        geo_source = {'geo_str': geo_str}
+    # choropleth map settings
+    map.choropleth(data=gtd_data,
+                   columns=['country', Feature],
+                   threshold_scale=[0, 10, 100, up/3, up*2/3, up],
+                   key_on='feature.properties.name',
+                   fill_color=Color, fill_opacity=0.7, line_opacity=0.2,
+                   legend_name='Damage Scale',  # folium is not supportive to show legend_name on python 3.5
+                   reset=True,
+                   **geo_source
+                   )
+    return map
+
+
+# the explanation shown instead of the map of 1993
+NO_DATA_1993 = 'Data of 1993 is not available in Global Terrorism Database.\n\
+Click the link to learn why.\nhttps://www.start.umd.edu/gtd/faq/'
+
+
 def plot_choropleth(Color, Feature, Year):
     '''
     Parameters
@@ -114,32 +237,13 @@ def plot_choropleth(Color, Feature, Year):
     '''
     # Catch the exceptions if the user chooses the year 1993.
     if int(Year) == 1993:
-        print('Data of 1993 is not available in Global Terrorism Database.\n\
-Click the link to learn why.\nhttps://www.start.umd.edu/gtd/faq/')
+        print(NO_DATA_1993)
 
     # Catch the exceptions if the user chooses a year out of data range
     elif int(Year) not in range(1970, 2016):
         raise NoDataError
     else:
-        gtd_data = Choropleth(Year, Feature).all_ctr_dam()
-        world_geo = r'countries.geo.json'
-        # The upper bound of scale bar
-        up = Choropleth(Year, Feature).scale_max()
-        # Set the map base
-        map = folium.Map(location=[32, -90],
-                         zoom_start=2,
-                         min_zoom=2,
-                         tiles='Mapbox bright')
-        # choropleth map settings
-        map.choropleth(geo_path=world_geo, data=gtd_data,
-                       columns=['country', Feature],
-                       threshold_scale=[0, 10, 100, up/3, up*2/3, up],
-                       key_on='feature.properties.name',
-                       fill_color=Color, fill_opacity=0.7, line_opacity=0.2,
-                       legend_name='Damage Scale',  # folium is not supportive to show legend_name on python 3.5
-                       reset=True
-                       )
-        return map
+        return make_choropleth_map(Color, Feature, int(Year))
 
 
 def year_slider():
@@ -162,16 +266,20 @@ def year_slider():
     return yr
 
 
+# color palettes of the choropleth map
+palette_options = {'Ocean': 'PuBu',
+                   'Orchid': 'RdPu',
+                   'NYU Pride': 'BuPu',
+                   'Alert': 'OrRd',
+                   'Grassland': 'GnBu',
+                   }
+
+
 def color_palette_picker():
     '''
     Return a string of color indicator from users' manual pick
     '''
-    return Dropdown(options={'Ocean': 'PuBu',
-                             'Orchid': 'RdPu',
-                             'NYU Pride': 'BuPu',
-                             'Alert': 'OrRd',
-                             'Grassland': 'GnBu',
-                             },
+    return Dropdown(options=palette_options,
                     value='PuBu',
                     description='Palette',
                     disabled=False,
@@ -179,13 +287,23 @@ def color_palette_picker():
                     )
 
 
-def Display_Your_Choropleth():
+def Display_Your_Choropleth(live=False):
     '''
     Allow users to interactively explore data information
-    and customize the choropleth map
+    and customize the choropleth map,
+    the rendered maps are cached by figure_cache
+    ---
+    Parameter
+        - live: debounce the widgets and render in the background, see live   | bool
     '''
+    if live:
+        # imported here since the live layer renders with this module
+        import live as lv
+        return lv.Display_Your_Choropleth()
+    # imported here since the figure cache renders with this module
+    import figure_cache as fc
     try:
-        interact(plot_choropleth,
+        interact(fc.plot_choropleth,
                  Year=year_slider(),
                  Feature=ht.feature3_picker(),
                  Color=color_palette_picker()
@@ -78,6 +78,40 @@ def save_df_csv():
     return make_df().to_csv('gtd_wholedata_selected.csv')
 
 
+# number of rows read at a time by the out-of-core functions
+CHUNKSIZE = 100000
+
+# key of the dataset in the HDF5 store, and room of its text columns
+HDF_KEY = 'gta'
+HDF_STRING_SIZE = 100
+
+
+# Data Preparation Functions
+def save_df_hdf(csv_path='gtd_wholedata_selected.csv', hdf_path='gtd_wholedata_selected.h5',
+                chunksize=CHUNKSIZE):
+    '''
+    copy the csv file with all selected features into an HDF5 table,
+    a chunk at a time, so the file may be larger than memory
+    ***
+    requires PyTables,
+    the binary store is faster to read in chunks than the csv file
+    ---
+    The table takes the columns of the first chunk, so the csv file is read twice:
+    once for the dtypes of the whole file, e.g. a text column with only missing values
+    in a chunk, once to copy the chunks with those dtypes.
+    '''
+    dtypes = {}
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        for column, dtype in chunk.dtypes.items():
+            dtypes[column] = ut.combine_dtypes(dtypes.get(column), dtype)
+    text_columns = [column for column, dtype in dtypes.items() if not pd.api.types.is_numeric_dtype(dtype)]
+    dtypes.update((column, object) for column in text_columns)
+    min_itemsize = {column: HDF_STRING_SIZE for column in text_columns}
+    with pd.HDFStore(hdf_path, mode='w') as store:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=dtypes):
+            store.append(HDF_KEY, chunk, format='table', min_itemsize=min_itemsize)
+
+
 ### Above are functions serve for data preparations
 ### for a better user experience
 ### we have pre-processed the dataset
@@ -92,6 +126,21 @@ def load_df():
     df = pd.read_csv('gtd_wholedata_selected.csv')
     return df
 
+def iter_df_chunks(path='gtd_wholedata_selected.csv', columns=None, chunksize=CHUNKSIZE):
+    '''
+    Parameters
+        - path      : csv file, or HDF5 store made by save_df_hdf    | str
+        - columns   : columns to read, all of them if None           | list
+        - chunksize : number of rows of a chunk                      | int
+    Return
+        the DataFrames of chunksize consecutive rows of the dataset,
+        for datasets larger than memory                              | iterator
+    '''
+    if re.match(r'.+\.(h5|hdf5?){1}$', path):
+        return pd.read_hdf(path, HDF_KEY, columns=columns, chunksize=chunksize)
+    return pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
 def df_year_idx():
     '''
     return the DataFrame with selected features, indexed by years
@@ -0,0 +1,218 @@
+'''
+This module keeps the results of the expensive functions on disk between sessions:
+    - the key of a result is the function, its arguments bound to its signature with the defaults,
+      a fingerprint of the content of the dataset file and the version of the code,
+      the content of every module of the package, since a result depends on the modules it calls,
+      hashed once per process
+    - a result computed from another dataset file or another version of the code
+      is never used, and is removed when the result is computed again
+    - the cache is limited in size, the least recently used results are evicted first
+
+The results are pickled, one file per result, in CACHE_DIR.
+
+Usage:
+    @lru_cache(maxsize=None)
+    @disk_cache.persistent
+    def region_totals():
+        ...
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import os
+import glob
+import pickle
+import hashlib
+import inspect
+import functools
+
+
+# the dataset file the results are computed from
+DATA_FILE = 'gtd_wholedata_selected.csv'
+
+# directory and size limit of the cache, see configure
+CACHE_DIR = '.gta_cache'
+MAX_BYTES = 512 * 2**20
+ENABLED = True
+
+# bump to invalidate every cached result, e.g. after upgrading pandas
+CACHE_VERSION = 1
+
+# the modules of the package the version of the code is computed from,
+# the tests do not change the results
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXCLUDED_MODULES = ('test.py',)
+
+# content hash of the files, by (path, size, modification time)
+_file_hashes = {}
+
+# content hash of the modules of the package, computed once per process
+_modules_digest = None
+
+
+def configure(cache_dir=None, max_bytes=None, enabled=None):
+    '''
+    Parameters
+        - cache_dir : directory of the cache                 | str
+        - max_bytes : size limit of the cache                | int
+        - enabled   : False to compute every result again    | bool
+    '''
+    global CACHE_DIR, MAX_BYTES, ENABLED
+    if cache_dir is not None:
+        CACHE_DIR = cache_dir
+    if max_bytes is not None:
+        MAX_BYTES = max_bytes
+    if enabled is not None:
+        ENABLED = enabled
+
+
+def file_hash(path):
+    '''
+    Return the sha1 of the content of the file, hashed again only when
+    its size or modification time changes                                | str
+    '''
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as data_file:
+            for chunk in iter(lambda: data_file.read(2**20), b''):
+                sha1.update(chunk)
+        _file_hashes[key] = sha1.hexdigest()
+    return _file_hashes[key]
+
+
+def dataset_fingerprint():
+    '''
+    Return the content hash of the dataset file   | str
+    '''
+    return file_hash(DATA_FILE)
+
+
+def code_version():
+    '''
+    Return the version of the code:
+    the content hashes of the modules of the package and CACHE_VERSION    | str
+    ---
+    The modules are hashed on the first call only, the code running in a process
+    does not change when its files are edited.
+    '''
+    global _modules_digest
+    if _modules_digest is None:
+        modules = sorted(path for path in glob.glob(os.path.join(PACKAGE_DIR, '*.py'))
+                         if os.path.basename(path) not in EXCLUDED_MODULES)
+        _modules_digest = digest([file_hash(path) for path in modules])
+    return digest((_modules_digest, CACHE_VERSION))
+
+
+def digest(value):
+    '''
+    Return a short hash of a picklable value   | str
+    '''
+    return hashlib.sha1(pickle.dumps(value, protocol=2)).hexdigest()[:20]
+
+
+def entry_paths(function, arguments):
+    '''
+    Parameters
+        - function  : the decorated function                                   | function
+        - arguments : the arguments of the call by parameter name, with the defaults   | dict
+    Return
+        (path of the result of the call, pattern of the paths of all the versions of that result)   | tuple
+    '''
+    name = '{}.{}-{}'.format(function.__module__, function.__qualname__,
+                             digest(tuple(arguments.items())))
+    version = digest((dataset_fingerprint(), code_version()))
+    return (os.path.join(CACHE_DIR, '{}-{}.pkl'.format(name, version)),
+            os.path.join(CACHE_DIR, glob.escape(name) + '-*.pkl'))
+
+
+def evict(max_bytes=None):
+    '''
+    Remove the least recently used results until the cache fits in max_bytes,
+    MAX_BYTES if None
+    '''
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for path in glob.glob(os.path.join(CACHE_DIR, '*.pkl')):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def _remove(path):
+    '''
+    Remove a file, unless another process already did
+    '''
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def persistent(function):
+    '''
+    Decorator: keep the results of the function on disk,
+    the arguments of the function must be picklable;
+    f(1), f(x=1) and f() with the default x=1 share their result
+    '''
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return function(*args, **kwargs)
+        try:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            path, versions = entry_paths(function, bound.arguments)
+        except TypeError:
+            # arguments not matching the signature raise in the function itself,
+            # unpicklable ones are not cached
+            return function(*args, **kwargs)
+        except OSError:
+            # no dataset file to fingerprint, nothing to key the result by
+            return function(*args, **kwargs)
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as cache_file:
+                    result = pickle.load(cache_file)
+                # the modification time orders the eviction
+                os.utime(path, None)
+                return result
+            except Exception:
+                # a broken entry is computed again
+                pass
+
+        result = function(*args, **kwargs)
+        # write then rename, so other processes never read a partial file
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(temporary, 'wb') as cache_file:
+                pickle.dump(result, cache_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+        except (OSError, pickle.PicklingError):
+            # the cache is only an optimization, the result is just not stored
+            _remove(temporary)
+            return result
+        # the other versions of the result are outdated
+        for outdated in glob.glob(versions):
+            if outdated != path:
+                _remove(outdated)
+        evict()
+        return result
+    return wrapper
@@ -2,7 +2,9 @@
 This module:
 1) Processes data within the Dot_Plot_Data class. This class is intended to be somewhat flexible so that programmers
 can consider alternate reconfigurations of the dot plot or use different data in the future.
-2) Defines a function that prepares a dot plot and then plots it.
+The Dot_Plot_TopK class answers the dot plot's top countries queries from a compact aggregate, without unstacking.
+2) Defines a function that prepares a dot plot and then plots it, and one that compares several attack types and
+metrics side by side in a faceted dot plot.
 3) Defines widgets that the user can manipulate so that they can alter the appearance of the dot plot.
 4) Defines a function that applies the input captured by the widgets to the dot plot.
 
@@ -15,15 +17,19 @@ from __future__ import print_function
 from ipywidgets import interact, interactive, fixed
 import ipywidgets as widgets
 
+import numpy as np
 import pandas as pd
 import seaborn as sns
+import matplotlib.pyplot as plt
 import math
+from functools import lru_cache
+import disk_cache
 
 from util import *
 from Geo2D import year_interval_slider
 import heatmap as ht
 
-global_terrorism = ht.GTA()
+global_terrorism = ht.load_gta()
 global_terrorism.gt_df.head()
 
 dot_plot_features = ['country', 'year', 'attacktype', 'casualties']
@@ -75,46 +81,130 @@ class Dot_Plot_Data():
         self.data = self.data.sort_values(self.label, ascending=False).iloc[0:20, :]
 
 
-def create_dot_plot(metric, attacktype, year_range):
-    '''Creates a dot plot with input specifications'''
+class Dot_Plot_TopK():
+    def __init__(self, data):
+        '''Counts and sums casualties by attack type, year and country in one pass, into dense arrays'''
+        data = data[['attacktype', 'year', 'country', 'casualties']].dropna(subset=['attacktype', 'year', 'country'])
+        attack_codes, self.attacktypes = pd.factorize(data['attacktype'], sort=True)
+        country_codes, self.countries = pd.factorize(data['country'], sort=True)
+        self.years = np.arange(data['year'].min(), data['year'].max() + 1)
+        year_codes = data['year'].values.astype(int) - self.years[0]
+
+        shape = (len(self.attacktypes), len(self.years), len(self.countries))
+        cells = np.ravel_multi_index((attack_codes, year_codes, country_codes), shape)
+        casualties = data['casualties'].fillna(0).values
+        totals = {'occurrences': np.bincount(cells, minlength=np.prod(shape)),
+                  'casualties': np.bincount(cells, weights=casualties, minlength=np.prod(shape))}
+        # running totals over the years, so any year range is a difference of two slices
+        self.cumulative = {}
+        for metric, total in totals.items():
+            cumulative = np.zeros((shape[0], shape[1] + 1, shape[2]))
+            cumulative[:, 1:, :] = np.cumsum(total.reshape(shape), axis=1)
+            self.cumulative[metric] = cumulative
+
+    def totals(self, metric, attack_types, year_tuple):
+        '''Returns the totals of every country for the attack types (rows) in the year range'''
+        first = int(np.clip(year_tuple[0] - self.years[0], 0, len(self.years)))
+        last = int(np.clip(year_tuple[1] - self.years[0] + 1, 0, len(self.years)))
+        rows = self.attacktypes.get_indexer(attack_types)
+        if (rows < 0).any():
+            raise KeyError('Unknown attack type: {}'.format(list(np.asarray(attack_types)[rows < 0])))
+        cumulative = self.cumulative[metric][rows]
+        return cumulative[:, last, :] - cumulative[:, first, :]
+
+    def top_k(self, metric, attack_type, year_tuple, k=20):
+        '''Returns the k countries with the largest totals, sorted, as a dataframe with columns country and label'''
+        values = self.totals(metric, [attack_type], year_tuple)[0]
+        return self.select_top_k(values, k, str.title(metric) + ' from ' + attack_type)
+
+    def top_k_many(self, metrics, attack_types, year_tuple, k=20):
+        '''Returns the top k countries of every metric and attack type in one long dataframe,
+        with columns metric, attacktype, rank, country and value'''
+        tables = []
+        for metric in metrics:
+            # one slice difference gives the totals of all the attack types
+            totals = self.totals(metric, attack_types, year_tuple)
+            for attack_type, values in zip(attack_types, totals):
+                top = self.select_top_k(values, k, 'value')
+                top.insert(0, 'rank', np.arange(1, len(top) + 1))
+                top.insert(0, 'attacktype', attack_type)
+                top.insert(0, 'metric', metric)
+                tables.append(top)
+        return pd.concat(tables, ignore_index=True)
+
+    def select_top_k(self, values, k, label):
+        '''Selects the k largest values with a partial sort, then sorts only those'''
+        k = min(k, len(values))
+        top = np.argpartition(-values, k - 1)[:k]
+        top = top[np.argsort(-values[top], kind='mergesort')]
+        return pd.DataFrame({'country': self.countries[top], label: values[top]}, columns=['country', label])
+
+
+@lru_cache(maxsize=None)
+@disk_cache.persistent
+def dot_plot_topk():
+    '''Returns the Dot_Plot_TopK of the whole dataset, built once per session and kept on disk until the dataset changes'''
+    return Dot_Plot_TopK(global_terrorism.gt_df)
+
+
+def draw_dot_plot(metric, attacktype, year_range, ax):
+    '''Draws the dot plot of the top 20 countries on the axes'''
     #Portions of this code were adapted from: http://seaborn.pydata.org/examples/pairgrid_dotplot.html
 
-    pd.options.mode.chained_assignment = None
-
-    dot_plot = Dot_Plot_Data(global_terrorism.gt_df, 'country', 'casualties', 'year', 'attacktype', metric)
-
-    dot_plot.user_selection(year_range, attacktype)
-    dot_plot.aggregate()
-    dot_plot.convert_series(str.title(metric) + ' from ' + attacktype)
-    dot_plot.take_top_20()
-
-    sns.set(style="whitegrid")
-
-    g = sns.PairGrid(dot_plot.data,
-                     x_vars=str.title(metric) + ' from ' + attacktype, y_vars=['country'],
-                     size=12, aspect=.50)
+    label = str.title(metric) + ' from ' + attacktype
+    top_20 = dot_plot_topk().top_k(metric, attacktype, year_range, 20)
 
     # Draw a dot plot using the stripplot function
-    g.map(sns.stripplot, size=10, orient="h",
-          palette="Blues_r", edgecolor="gray")
-
-    xmax = math.ceil(max(dot_plot.data[dot_plot.label])/1000)*1000
-
-    g.set(xlim=(0, xmax), xlabel=str.title(metric), ylabel=str.title(dot_plot.yaxis_vals))
+    sns.stripplot(x=label, y='country', data=top_20, ax=ax, size=10, orient="h",
+                  palette="Blues_r", edgecolor="gray")
 
-    # Use meaningful titles for the columns
-    titles = ['Top Countries by ' + attacktype + ' ' + str.title(metric)]
+    xmax = math.ceil(max(top_20[label])/1000)*1000
 
-    for ax, title in zip(g.axes.flat, titles):
+    # Use a meaningful title
+    ax.set(xlim=(0, xmax), xlabel=str.title(metric), ylabel='Country',
+           title='Top Countries by ' + attacktype + ' ' + str.title(metric))
 
-        # Set a different title for each axes
-        ax.set(title=title)
+    # Make the grid horizontal instead of vertical
+    ax.xaxis.grid(False)
+    ax.yaxis.grid(True)
 
-        # Make the grid horizontal instead of vertical
-        ax.xaxis.grid(False)
-        ax.yaxis.grid(True)
+    sns.despine(ax=ax, left=True, bottom=True)
 
-    sns.despine(left=True, bottom=True)
+def create_dot_plot(metric, attacktype, year_range):
+    '''Creates a dot plot with input specifications'''
+    sns.set(style="whitegrid")
+    fig = plt.figure(figsize=(6, 12))
+    draw_dot_plot(metric, attacktype, year_range, fig.gca())
+    plt.show()
+
+def create_dot_plot_comparison(metrics, attacktypes, year_range, k=10):
+    '''Creates a faceted dot plot with one column per attack type and one row per metric'''
+    metrics, attacktypes = list(metrics), list(attacktypes)
+    if not metrics or not attacktypes:
+        print('Please select at least one metric and one attack type.')
+        return
+    top = dot_plot_topk().top_k_many(metrics, attacktypes, year_range, k)
+
+    # the style only applies to this figure, the other plots keep theirs
+    with sns.axes_style("whitegrid"):
+        fig, axes = plt.subplots(len(metrics), len(attacktypes), squeeze=False,
+                                 figsize=(6 * len(attacktypes), 0.4 * k * len(metrics) + 1))
+        for row, metric in enumerate(metrics):
+            for col, attacktype in enumerate(attacktypes):
+                ax = axes[row, col]
+                facet = top[(top.metric == metric) & (top.attacktype == attacktype)]
+                # color by country, the palette without hue is deprecated in seaborn
+                sns.stripplot(x='value', y='country', hue='country', data=facet, ax=ax, size=8, orient="h",
+                              palette="Blues_r", legend=False, edgecolor="gray", linewidth=1)
+                ax.set(title=attacktype if row == 0 else '', ylabel='', xlabel=str.title(metric),
+                       xlim=(0, max(1, facet['value'].max()) * 1.1))
+                # Make the grid horizontal instead of vertical
+                ax.xaxis.grid(False)
+                ax.yaxis.grid(True)
+        fig.suptitle('Top Countries by Attack Type, {}-{}'.format(year_range[0], year_range[1]), size=16)
+        sns.despine(left=True, bottom=True)
+    fig.tight_layout(rect=(0, 0, 1, 0.97))
+    plt.show()
 
 def attack_type():
     '''Return a string corresponding to an attack type'''
@@ -139,8 +229,34 @@ def metric_selection():
                          tooltip='Description')
     return metric
 
+def attack_types_selection():
+    '''Return a tuple of attack types from users' manual pick'''
+    attacktypes = sorted(set(global_terrorism.gt_df['attacktype']))
+    return widgets.SelectMultiple(options=attacktypes,
+                                  value=tuple(attacktypes[:3]),
+                                  description='Attack Types:',
+                                  disabled=False)
+
+def metrics_selection():
+    '''Return a tuple of metrics from users' manual pick'''
+    return widgets.SelectMultiple(options={'Occurrences': 'occurrences', 'Casualties': 'casualties'},
+                                  value=('occurrences', 'casualties'),
+                                  description='Metrics:',
+                                  disabled=False)
+
 def Display_Your_Dot_Plot():
     '''
-    Allow users to customize the dot plot
+    Allow users to customize the dot plot,
+    the rendered dot plots are cached by figure_cache
+    '''
+    # imported here since the figure cache renders with this module
+    import figure_cache as fc
+    interact(fc.create_dot_plot, metric = metric_selection(), attacktype = attack_type(), year_range = year_interval_slider());
+
+
+def Display_Your_Dot_Plot_Comparison():
+    '''
+    Allow users to compare several attack types and metrics in one faceted dot plot
     '''
-    interact(create_dot_plot, metric = metric_selection(), attacktype = attack_type(), year_range = year_interval_slider());
+    interact(create_dot_plot_comparison, metrics = metrics_selection(), attacktypes = attack_types_selection(),
+             year_range = year_interval_slider(), k = fixed(10));
@@ -0,0 +1,292 @@
+'''
+This module caches the rendered visualizations of the widgets:
+    - an LRU cache bounded by a number of entries and a number of bytes
+    - the key is the chart and the normalized arguments of its Display_Your_* callback
+    - hit and miss statistics
+    - the cached callbacks of every chart, which show the cached image or html
+    - the year sliders prefetch their neighbouring states, see prefetch
+
+Revisiting a widget state shows the stored image instead of drawing again.
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import threading
+import numpy as np
+from collections import OrderedDict
+from IPython.display import display, Image, HTML
+
+import AnalysisAndLinePlot as al
+import choropleth as cr
+import prefetch
+import render
+
+
+# bounds of the cache
+MAX_ENTRIES = 128
+MAX_BYTES = 256 * 2**20
+
+
+def normalize_value(value):
+    '''
+    Return the value in a canonical hashable form:
+    stripped strings, python numbers and tuples instead of lists   | object
+    '''
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(normalize_value(item) for item in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def normalize_params(**params):
+    '''
+    Return the parameters in canonical form, by name,
+    the values the charts are rendered with and keyed by   | dict
+    '''
+    return {name: normalize_value(value) for name, value in params.items()}
+
+
+def cache_key(chart, **params):
+    '''
+    Return the key of a rendered chart, independent of the order of the parameters   | tuple
+    '''
+    return (chart,) + tuple(sorted(normalize_params(**params).items()))
+
+
+class FigureCache(object):
+    '''
+    Attributes:
+        - self.max_entries: maximum number of rendered outputs
+        - self.max_bytes:   maximum total size of the rendered outputs
+        - self.entries:     rendered outputs (bytes or str) by key, least recently used first
+        - self.nbytes:      total size of the entries
+        - self.unshown:     keys of the prefetched entries not yet asked for
+        - self.hits, self.misses
+    Method:
+        - get a rendered output, rendering it on a miss
+        - prefetch an output, only evicting the prefetched entries not yet shown
+        - discard a prefetched entry not yet shown
+        - statistics of the cache
+    '''
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.unshown = set()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _evict(self, key):
+        '''
+        Remove an entry, the lock being held
+        '''
+        self.nbytes -= len(self.entries.pop(key))
+        self.unshown.discard(key)
+
+    def get(self, key, render_output):
+        '''
+        Parameters
+            - key           : output of cache_key                      | tuple
+            - render_output : function rendering the output on a miss  | function
+        Return
+            the rendered output, an output larger than max_bytes is not stored   | bytes or str
+        '''
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.unshown.discard(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        # render outside of the lock, the errors of invalid arguments are not cached
+        output = render_output()
+        size = len(output)
+        if size > self.max_bytes:
+            return output
+        with self._lock:
+            if key not in self.entries:
+                self.entries[key] = output
+                self.nbytes += size
+            while len(self.entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self._evict(next(iter(self.entries)))
+        return output
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self.entries
+
+    def prefetch(self, key, render_output):
+        '''
+        Parameters
+            - key           : output of cache_key                | tuple
+            - render_output : function rendering the output      | function
+        Return
+            the rendered output, None if it is already cached or would evict
+            an entry the user has seen; the hits and misses are unchanged    | bytes or str
+        '''
+        if key in self:
+            return None
+        output = render_output()
+        size = len(output)
+        with self._lock:
+            if key in self.entries:
+                return None
+            # make room by replacing the oldest prefetched entries never shown
+            unshown = [old for old in self.entries if old in self.unshown]
+            n_free = self.max_entries - len(self.entries)
+            free_bytes = self.max_bytes - self.nbytes
+            n_evicted = 0
+            while (n_free < 1 or free_bytes < size) and n_evicted < len(unshown):
+                n_free += 1
+                free_bytes += len(self.entries[unshown[n_evicted]])
+                n_evicted += 1
+            if n_free < 1 or free_bytes < size:
+                return None
+            for old in unshown[:n_evicted]:
+                self._evict(old)
+            # least recently used, so the renders the user has seen are kept longer
+            self.entries[key] = output
+            self.entries.move_to_end(key, last=False)
+            self.unshown.add(key)
+            self.nbytes += size
+        return output
+
+    def discard_unshown(self, key):
+        '''
+        Remove a prefetched entry if the user has not asked for it
+        '''
+        with self._lock:
+            if key in self.unshown:
+                self._evict(key)
+
+    def stats(self):
+        '''
+        Return the hits, misses, hit rate, entries and size of the cache   | dict
+        '''
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / requests if requests else 0.0,
+                    'entries': len(self.entries),
+                    'bytes': self.nbytes}
+
+    def clear(self):
+        '''
+        Remove all the entries and reset the statistics
+        '''
+        with self._lock:
+            self.entries.clear()
+            self.unshown.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+# the cache shared by the widgets of the session
+figure_cache = FigureCache()
+
+# renders the neighbouring states of the year sliders in the background
+prefetcher = prefetch.Prefetcher(figure_cache, background=render.background)
+
+
+def density_png(Year, MapStyle):
+    '''
+    Return the cached image of the 2D Geo Map, and prefetch the adjacent intervals   | bytes
+    '''
+    params = normalize_params(Year=Year, MapStyle=MapStyle)
+    key = cache_key('density', **params)
+    prefetcher.requested(key)
+    png = figure_cache.get(key, lambda: render.render_2D_density(**params))
+    prefetcher.schedule([(cache_key('density', Year=interval, MapStyle=params['MapStyle']),
+                          lambda interval=interval: render.render_2D_density(interval, params['MapStyle']))
+                         for interval in prefetch.adjacent_intervals(params['Year'])])
+    return png
+
+
+def plot_2D_density(Year, MapStyle):
+    '''
+    Cached Geo2D.plot_2D_density
+    '''
+    display(Image(data=density_png(Year, MapStyle), format='png'))
+
+
+def heatmap_png(Feature, Region, Cmap):
+    '''
+    Return the cached image of the heatmap   | bytes
+    '''
+    params = normalize_params(Feature=Feature, Region=Region, Cmap=Cmap)
+    return figure_cache.get(cache_key('heatmap', **params),
+                            lambda: render.render_heatmap_by_region(**params))
+
+
+def Heatmap_by_region(Feature, Region, Cmap):
+    '''
+    Cached heatmap.Heatmap_by_region
+    '''
+    display(Image(data=heatmap_png(Feature, Region, Cmap), format='png'))
+
+
+def create_dot_plot(metric, attacktype, year_range):
+    '''
+    Cached dot_plot.create_dot_plot
+    '''
+    params = normalize_params(metric=metric, attacktype=attacktype, year_range=year_range)
+    png = figure_cache.get(cache_key('dot_plot', **params), lambda: render.render_dot_plot(**params))
+    display(Image(data=png, format='png'))
+
+
+def create_bubble_chart(year):
+    '''
+    Cached bubble_chart.Bubble_Chart_Data.create_bubble_chart
+    '''
+    year = normalize_value(year)
+    key = cache_key('bubble_chart', year=year)
+    prefetcher.requested(key)
+    png = figure_cache.get(key, lambda: render.render_bubble_chart(year))
+    display(Image(data=png, format='png'))
+    prefetcher.schedule([(cache_key('bubble_chart', year=period),
+                          lambda period=period: render.render_bubble_chart(period))
+                         for period in prefetch.adjacent_periods(year)])
+
+
+def analy_and_plot(Country, Feature, Color, Horizon=0):
+    '''
+    Cached AnalysisAndLinePlot.analy_and_plot, the statistical analysis is looked up
+    '''
+    params = normalize_params(Country=Country, Feature=Feature, Color=Color, Horizon=Horizon)
+    png = figure_cache.get(cache_key('line_plot', **params), lambda: render.render_analy_and_plot(**params))
+    display(Image(data=png, format='png'))
+    print(al.analy_ctr(params['Country']))
+
+
+def choropleth_html(Color, Feature, Year):
+    '''
+    Return the cached html of the choropleth map of a year with data,
+    and prefetch the adjacent years                                    | str
+    '''
+    params = normalize_params(Color=Color, Feature=Feature, Year=int(Year))
+    key = cache_key('choropleth', **params)
+    prefetcher.requested(key)
+    page = figure_cache.get(key, lambda: cr.plot_choropleth(**params)._repr_html_())
+    prefetcher.schedule([(cache_key('choropleth', Color=params['Color'], Feature=params['Feature'], Year=year),
+                          lambda year=year: cr.plot_choropleth(params['Color'], params['Feature'], year)._repr_html_())
+                         for year in prefetch.adjacent_years(params['Year'])])
+    return page
+
+
+def plot_choropleth(Color, Feature, Year):
+    '''
+    Cached choropleth.plot_choropleth, the html of the map is stored
+    '''
+    if int(Year) == 1993:
+        return cr.plot_choropleth(Color, Feature, Year)
+    display(HTML(choropleth_html(Color, Feature, Year)))
@@ -0,0 +1,103 @@
+'''
+This module forecasts the next years of yearly series
+for all the countries at once, on a country x year matrix:
+    - Holt's linear trend (double exponential smoothing)
+    - the smoothing parameters of every country are picked from a grid,
+      all the countries and parameters are fitted together with array operations
+    - point forecasts and prediction intervals of the next years
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import numpy as np
+import pandas as pd
+
+
+# candidate smoothing parameters of the level and the trend
+ALPHAS = np.linspace(0.1, 1.0, 10)
+BETAS = np.linspace(0.0, 0.9, 10)
+
+# z-score of the 95% prediction interval
+Z_95 = 1.96
+
+
+def holt_fit(values, alphas=ALPHAS, betas=BETAS):
+    '''
+    Parameters
+        - values: one series per row, at least three values        | np.array
+        - alphas: candidate smoothing parameters of the level     | np.array
+        - betas : candidate smoothing parameters of the trend     | np.array
+    Return
+        a dict with alpha, beta, the last level and trend,
+        and sigma (standard deviation of the one-step errors) of every row,
+        the parameters minimize the sum of squared one-step errors  | dict
+    ---
+    Every (alpha, beta) pair is one row of the state arrays,
+    so the only loop is over the years.
+    '''
+    values = np.asarray(values, dtype=float)
+    if values.shape[1] < 3:
+        raise ValueError('At least three years are needed to fit a trend.')
+    alpha, beta = [grid.ravel()[:, np.newaxis] for grid in np.meshgrid(alphas, betas)]
+    n_params, n_series = len(alpha), values.shape[0]
+    level = np.tile(values[:, 0], (n_params, 1))
+    trend = np.tile(values[:, 1] - values[:, 0], (n_params, 1))
+    sse = np.zeros((n_params, n_series))
+    for t in range(1, values.shape[1]):
+        error = values[:, t] - (level + trend)
+        sse += error ** 2
+        new_level = alpha * values[:, t] + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+
+    best = np.argmin(sse, axis=0)
+    columns = np.arange(n_series)
+    return {'alpha': alpha[best, 0],
+            'beta': beta[best, 0],
+            'level': level[best, columns],
+            'trend': trend[best, columns],
+            'sigma': np.sqrt(sse[best, columns] / (values.shape[1] - 1))}
+
+
+def holt_forecast(fit, horizon, z=Z_95):
+    '''
+    Parameters
+        - fit     : output of holt_fit                  | dict
+        - horizon : number of years to forecast         | int
+        - z       : z-score of the prediction interval  | float
+    Return
+        (forecasts, lower bounds, upper bounds) of every row
+        for the next horizon years, clipped at zero       | tuple
+    '''
+    steps = np.arange(1, horizon + 1)
+    forecast = fit['level'][:, np.newaxis] + steps * fit['trend'][:, np.newaxis]
+    # variance of the h-step error: sigma^2 * (1 + sum_{j<h} alpha^2 (1 + j beta)^2)
+    j = np.arange(horizon)
+    terms = (fit['alpha'][:, np.newaxis] * (1 + j * fit['beta'][:, np.newaxis])) ** 2
+    terms[:, 0] = 1
+    width = z * fit['sigma'][:, np.newaxis] * np.sqrt(np.cumsum(terms, axis=1))
+    return (np.clip(forecast, 0, None),
+            np.clip(forecast - width, 0, None),
+            np.clip(forecast + width, 0, None))
+
+
+class HoltForecast(object):
+    '''
+    Attributes:
+        - self.alpha, self.beta: fitted smoothing parameters of every country  | Series
+        - self.forecast:         point forecasts                               | DataFrame
+        - self.lower:            lower bounds of the prediction intervals      | DataFrame
+        - self.upper:            upper bounds of the prediction intervals      | DataFrame
+        the DataFrames are indexed by country with a column per future year
+    '''
+    def __init__(self, matrix, horizon=5):
+        fit = holt_fit(matrix.values)
+        years = list(range(int(matrix.columns[-1]) + 1, int(matrix.columns[-1]) + horizon + 1))
+        as_frame = lambda result: pd.DataFrame(result, index=matrix.index, columns=years)
+        forecast, lower, upper = holt_forecast(fit, horizon)
+        self.alpha = pd.Series(fit['alpha'], index=matrix.index)
+        self.beta = pd.Series(fit['beta'], index=matrix.index)
+        self.forecast = as_frame(forecast)
+        self.lower = as_frame(lower)
+        self.upper = as_frame(upper)
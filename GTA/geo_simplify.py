@@ -0,0 +1,278 @@
+'''
+This module:
+    - simplifies the country geometries in the geo json file
+      with the Douglas-Peucker algorithm at several tolerances
+    - keeps the shared borders between neighbouring countries identical,
+      so no gaps or overlaps appear on the map after simplification
+    - stores every simplified geometry as a json file next to the original one
+    - picks the simplified geometry that suits the zoom level a map is opened at
+
+The full resolution 'countries.geo.json' is embedded in every choropleth map,
+running save_simplified_geojson() once makes the choropleth maps much lighter.
+A map keeps the geometry of its starting zoom level when the user zooms in.
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import os
+import json
+
+
+# tolerance (in degrees) and number of decimals kept of every resolution level
+TOLERANCES = {'low': (1.0, 1),
+              'medium': (0.1, 2),
+              'high': (0.02, 3)}
+
+# the lowest zoom level at which each resolution level is used
+ZOOM_LEVELS = [(0, 'low'),
+               (4, 'medium'),
+               (7, 'high')]
+
+GEO_PATH = 'countries.geo.json'
+
+
+def simplified_path(level, geo_path=GEO_PATH):
+    '''
+    Parameters
+        - level    : resolution level, e.g. 'low'       | str
+        - geo_path : path of the original geo json file | str
+    Return
+        path of the simplified geo json file            | str
+    '''
+    root, ext = os.path.splitext(geo_path)
+    return '{}.{}{}'.format(root, level, ext)
+
+
+def _perpendicular_distance(point, start, end):
+    '''
+    Return the distance between a point and the line through start and end
+    '''
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return ((point[0] - start[0])**2 + (point[1] - start[1])**2) ** 0.5
+    return abs(dy*point[0] - dx*point[1] + end[0]*start[1] - end[1]*start[0]) / (dx*dx + dy*dy) ** 0.5
+
+
+def douglas_peucker(line, tolerance):
+    '''
+    Parameters
+        - line      : list of [lon, lat] points      | list
+        - tolerance : maximum distance to the line   | float
+    Return
+        the simplified line, the two end points are always kept   | list
+    '''
+    if len(line) < 3:
+        return list(line)
+    keep = [False] * len(line)
+    keep[0] = keep[-1] = True
+    # use an explicit stack instead of recursion for long borders
+    stack = [(0, len(line) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = 0.0, first
+        for i in range(first + 1, last):
+            dist = _perpendicular_distance(line[i], line[first], line[last])
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(line, keep) if kept]
+
+
+def _rings(geometry):
+    '''
+    Return all the rings of a Polygon or MultiPolygon geometry   | list
+    '''
+    if geometry['type'] == 'Polygon':
+        return list(geometry['coordinates'])
+    return [ring for polygon in geometry['coordinates'] for ring in polygon]
+
+
+def find_junctions(geo):
+    '''
+    Parameter
+        - geo: geo json content     | dict
+    Return
+        points where three or more borders meet         | set
+    ---
+    A point on a border shared by two countries has the same two neighbours
+    in both rings, a point with more than two distinct neighbours is where
+    the shared border ends, so it must survive the simplification.
+    '''
+    neighbours = {}
+    for feature in geo['features']:
+        for ring in _rings(feature['geometry']):
+            points = [tuple(p) for p in ring[:-1]]
+            for i, point in enumerate(points):
+                adjacent = neighbours.setdefault(point, set())
+                adjacent.add(points[i - 1])
+                adjacent.add(points[(i + 1) % len(points)])
+    return set(point for point, adjacent in neighbours.items() if len(adjacent) > 2)
+
+
+def simplify_ring(ring, tolerance, junctions, arcs):
+    '''
+    Parameters
+        - ring      : closed ring of [lon, lat] points              | list
+        - tolerance : tolerance of the Douglas-Peucker algorithm    | float
+        - junctions : points that are never removed                 | set
+        - arcs      : simplified arcs shared between the rings      | dict
+    Return
+        the simplified closed ring, None if it collapsed to less than a triangle   | list
+    ---
+    The ring is cut into arcs at the junctions, every arc is simplified once
+    and looked up in arcs when a neighbour country walks the same border.
+    '''
+    points = [tuple(p) for p in ring[:-1]]
+    if len(points) < 3:
+        return None
+    cuts = [i for i, point in enumerate(points) if point in junctions]
+    if not cuts:
+        # islands and enclaves: start from the same point in every ring
+        cuts = [points.index(min(points))]
+    # rotate the ring so that it starts and ends at a cut point
+    start = cuts[0]
+    points = points[start:] + points[:start] + [points[start]]
+    cuts = [i - start for i in cuts] + [len(points) - 1]
+
+    simplified = [points[0]]
+    for first, last in zip(cuts[:-1], cuts[1:]):
+        arc = points[first:last + 1]
+        # an arc walked backwards by the neighbour is stored only once
+        key = min(tuple(arc), tuple(reversed(arc)))
+        if key not in arcs:
+            arcs[key] = douglas_peucker(list(key), tolerance)
+        piece = arcs[key] if key == tuple(arc) else list(reversed(arcs[key]))
+        simplified.extend(piece[1:])
+
+    if len(simplified) < 4:
+        return None
+    return simplified
+
+
+def _round_ring(ring, precision):
+    '''
+    Return the ring with rounded coordinates   | list
+    '''
+    return [[round(p[0], precision), round(p[1], precision)] for p in ring]
+
+
+def _outline(ring):
+    '''
+    Return the closed ring through the westmost, northmost, eastmost
+    and southmost points of the ring, in the original order   | list
+    '''
+    extremes = [min(ring, key=lambda p: p[0]), max(ring, key=lambda p: p[1]),
+                max(ring, key=lambda p: p[0]), min(ring, key=lambda p: p[1])]
+    outline = []
+    for point in ring[:-1]:
+        if point in extremes and point not in outline:
+            outline.append(point)
+    if len(outline) < 3:
+        return ring
+    return outline + [outline[0]]
+
+
+def simplify_polygon(polygon, tolerance, precision, junctions, arcs):
+    '''
+    Parameters
+        - polygon: outer ring followed by its holes     | list
+    Return
+        the simplified polygon, None if the outer ring collapsed   | list
+    ---
+    Collapsed holes are dropped, they are smaller than the tolerance.
+    '''
+    rings = [simplify_ring(ring, tolerance, junctions, arcs) for ring in polygon]
+    if rings[0] is None:
+        return None
+    return [_round_ring(ring, precision) for ring in rings if ring is not None]
+
+
+def simplify_geojson(geo, tolerance, precision):
+    '''
+    Parameters
+        - geo       : geo json content                   | dict
+        - tolerance : tolerance in degrees               | float
+        - precision : number of decimals kept            | int
+    Return
+        a new geo json content with simplified geometries   | dict
+    ---
+    Small islands that collapse are dropped,
+    but every country keeps at least its largest polygon.
+    '''
+    junctions = find_junctions(geo)
+    arcs = {}
+    features = []
+    for feature in geo['features']:
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            polygons = [geometry['coordinates']]
+        else:
+            polygons = geometry['coordinates']
+        simplified = [simplify_polygon(polygon, tolerance, precision, junctions, arcs)
+                      for polygon in polygons]
+        kept = [polygon for polygon in simplified if polygon is not None]
+        if not kept:
+            # the whole country is smaller than the tolerance, keep an outline of its largest polygon
+            largest = max(polygons, key=lambda polygon: len(polygon[0]))
+            kept = [[_round_ring(_outline(largest[0]), precision)]]
+        if len(kept) == 1:
+            new_geometry = {'type': 'Polygon', 'coordinates': kept[0]}
+        else:
+            new_geometry = {'type': 'MultiPolygon', 'coordinates': kept}
+        features.append({'type': feature['type'],
+                         'id': feature.get('id'),
+                         'properties': feature['properties'],
+                         'geometry': new_geometry})
+    return {'type': geo['type'], 'features': features}
+
+
+def save_simplified_geojson(geo_path=GEO_PATH, tolerances=TOLERANCES):
+    '''
+    Preprocessing step: write one simplified geo json file per resolution level
+    Return
+        paths of the written files keyed by resolution level   | dict
+    '''
+    # data.load_json_file always reads countries.geo.json, open the chosen file instead
+    with open(geo_path) as json_file:
+        geo = json.load(json_file)
+    paths = {}
+    for level, (tolerance, precision) in tolerances.items():
+        path = simplified_path(level, geo_path)
+        with open(path, 'w') as json_file:
+            # compact separators, the file is embedded in the map as it is
+            json.dump(simplify_geojson(geo, tolerance, precision), json_file, separators=(',', ':'))
+        paths[level] = path
+    return paths
+
+
+def level_for_zoom(zoom):
+    '''
+    Parameter
+        - zoom: zoom level of the map       | int
+    Return
+        the resolution level for the zoom   | str
+    '''
+    chosen = ZOOM_LEVELS[0][1]
+    for min_zoom, level in ZOOM_LEVELS:
+        if zoom >= min_zoom:
+            chosen = level
+    return chosen
+
+
+def geo_path_for_zoom(zoom, geo_path=GEO_PATH):
+    '''
+    Parameter
+        - zoom: zoom level of the map          | int
+    Return
+        path of the geo json file to embed in the map,
+        the original file if the simplified one has not been generated yet   | str
+    '''
+    path = simplified_path(level_for_zoom(zoom), geo_path)
+    if os.path.exists(path):
+        return path
+    return geo_path
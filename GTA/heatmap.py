@@ -3,6 +3,7 @@ This module includes:
     - GTA class, with the attrubutes:
         1. feature-selected dataframe of Global Terrorism Database
         2. a unieque list of region names
+    - cached country x year pivot tables of every region and feature
     - visualization function of the dataset in heatmap
     - the target feature
     - the visualizing color palette
@@ -13,8 +14,11 @@ Project co-author: Caroline Roper (cer446)
 
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
+from functools import lru_cache
+import disk_cache
 from util import *
 from data import *
 from ipywidgets import interact, ToggleButtons, Dropdown
@@ -25,12 +29,26 @@ class GTA(object):
     contains attributes of:
         - DataFrame of Global Terrorism data selection
         - list of all regions' names
+        - dict of the country names of every region
+        - Series of the number of countries in every region
         - function of get
     '''
     def __init__(self):
         self.gt_df = load_df()
         self.region_names = self.gt_df.region.unique().tolist()
+        self.index_countries_by_region()
 
+    def index_countries_by_region(self):
+        '''
+        Group the unique (region, country) pairs in one pass over the data,
+        instead of filtering the whole DataFrame once per region
+        '''
+        pairs = self.gt_df.dropna()[['region', 'country']].drop_duplicates()
+        grouped = pairs.groupby('region', sort=False).country
+        self.region_countries = {region: np.array([], dtype=object) for region in self.region_names}
+        for region, countries in grouped:
+            self.region_countries[region] = countries.values
+        self.region_country_counts = grouped.size().reindex(self.region_names, fill_value=0)
 
     def countries_by_region(self):
         '''
@@ -38,10 +56,124 @@ class GTA(object):
             - keys:    region names
             - values:  country names keyed by certain region
         '''
-        country_names = {}
-        for region in self.region_names:
-            country_names[region] = self.gt_df[self.gt_df.region == region].dropna().country.unique()
-        return country_names
+        return dict(self.region_countries)
+
+
+@lru_cache(maxsize=None)
+@disk_cache.persistent
+def load_gta():
+    '''
+    Return the GTA object of the whole dataset, loaded only once per session
+    and kept on disk until the dataset changes
+    '''
+    return GTA()
+
+
+@lru_cache(maxsize=None)
+@disk_cache.persistent
+def region_totals():
+    '''
+    Return the sums of all the features
+    grouped by region, country and year in one pass      | DataFrame
+    '''
+    df = load_gta().gt_df
+    return df.groupby(['region', 'country', 'year'])[['kills', 'wounds', 'casualties']].sum()
+
+
+# name of the pseudo region with all the countries of the world
+ALL_REGIONS = 'All Regions'
+
+# heatmaps with more cells than this are drawn as a single image
+FAST_HEATMAP_CELLS = 2000
+
+
+@lru_cache(maxsize=64)
+@disk_cache.persistent
+def region_pivot(Region, Feature):
+    '''
+    Parameters
+        - Region : name of region, or ALL_REGIONS     | str
+        - Feature: feature of damages                 | str
+    Return
+        the pivot table of the chosen Feature, indexed by the countries
+        of the chosen Region, with a column per year                    | DataFrame
+    ---
+    The last 64 pivot tables are kept, which covers all the regions and features,
+    so switching the widgets back and forth does not recompute them.
+    '''
+    if Region == ALL_REGIONS:
+        totals = region_totals()[Feature].groupby(level=['country', 'year']).sum()
+    else:
+        totals = region_totals().loc[Region, Feature]
+    return totals.unstack('year').fillna(0)
+
+
+def use_fast_heatmap(pivot_table, fast=None):
+    '''
+    Return whether to draw the heatmap as a single image:
+    the choice of fast if given, otherwise whether the heatmap is large   | bool
+    '''
+    if fast is None:
+        return pivot_table.size > FAST_HEATMAP_CELLS
+    return fast
+
+
+def heatmap_height(Region, fast):
+    '''
+    Return the height of the figure, proportional to
+    the number of countries in the chosen region             | int
+    '''
+    if Region == ALL_REGIONS:
+        n_countries = load_gta().region_country_counts.sum()
+    else:
+        n_countries = load_gta().region_country_counts[Region]
+    height = int(n_countries*3/4)
+    if fast:
+        # the cells of a single image are not square, keep the figure readable
+        height = max(5, min(height, 40))
+    return height
+
+
+def draw_heatmap(pivot_table, Feature, Region, Cmap, ax, fast=None):
+    '''
+    Parameters
+        - pivot_table: country x year values        | DataFrame
+        - Feature    : feature of damages           | str
+        - Region     : name of region               | str
+        - Cmap       : color map                    | str
+        - ax         : axes to draw on              | matplotlib Axes
+        - fast       : draw a single image instead of one patch per cell,
+                       decided by the size of the heatmap if None   | bool
+    '''
+    ax.set_title('Yearly Number of {} in {} by Terror Attacks (1970-2015)\n'.format(Feature.capitalize(),
+                                                                                  Region), size = 20)
+    ax.set_xlabel('Regions', size = 14)
+    ax.set_ylabel('Years', size = 14)
+
+    if not use_fast_heatmap(pivot_table, fast):
+        # use pivot table to plot heatmap
+        sns.heatmap(pivot_table,
+                    annot=False,
+                    fmt='.0f',
+                    linewidths=.5,
+                    square=True,
+                    cmap=Cmap,
+                    cbar_kws={"orientation": "horizontal"},
+                    ax=ax
+                    )
+        plt.setp(ax.get_xticklabels(), rotation=-15)
+        return
+
+    # one image for all the cells, with the same labels and colorbar as seaborn
+    image = ax.imshow(pivot_table.values, cmap=Cmap, aspect='auto', interpolation='nearest')
+    ax.set_xticks(np.arange(pivot_table.shape[1]))
+    ax.set_xticklabels(pivot_table.columns, rotation=-15)
+    ax.set_yticks(np.arange(pivot_table.shape[0]))
+    ax.set_yticklabels(pivot_table.index)
+    ax.set_xlabel(pivot_table.columns.name)
+    ax.set_ylabel(pivot_table.index.name)
+    ax.grid(False)
+    ax.figure.colorbar(image, ax=ax, orientation='horizontal')
 
 
 def Heatmap_by_region(Feature, Region, Cmap):
@@ -55,34 +187,14 @@ def Heatmap_by_region(Feature, Region, Cmap):
             of a comparison of values by chosen Feature
             among countrys in chosen region, colored with chosen cmap
     '''
-    dat = GTA().gt_df[GTA().gt_df.region == Region]  # DataFrame filtered with region
-    couple_cols = dat[['year', 'country', Feature]]
-    couple_cols.reset_index(inplace=True)
-    cp_cols = couple_cols.drop('index', 1)
-    y_c = cp_cols.groupby(['year', 'country']).sum()
-    y_c = y_c.reset_index()
+    # use pivot table to set data in heatmap plot format
+    pivot_table = region_pivot(Region, Feature)
+    fast = use_fast_heatmap(pivot_table)
 
     # proportionally set the height of the figure size
     # by the number of countries in the chosen region
-    fig = plt.figure(figsize=(25, int(len(GTA().countries_by_region()[Region])*3/4)))
-
-    # use pivot table to set data in heatmap plot format
-    pivot_table = y_c.pivot('country', 'year', Feature).fillna(0)
-    plt.title('Yearly Number of {} in {} by Terror Attacks (1970-2015)\n'.format(Feature.capitalize(),
-                                                                               Region), size = 20)
-    plt.xlabel('Regions', size = 14)
-    plt.ylabel('Years', size = 14)
-    plt.xticks(rotation=-15)
-
-    # use pivot table to plot heatmap
-    sns.heatmap(pivot_table,
-                annot=False,
-                fmt='.0f',
-                linewidths=.5,
-                square=True,
-                cmap=Cmap,
-                cbar_kws={"orientation": "horizontal"}
-                )
+    fig = plt.figure(figsize=(25, heatmap_height(Region, fast)))
+    draw_heatmap(pivot_table, Feature, Region, Cmap, plt.gca(), fast)
     plt.show()
 
 
@@ -90,7 +202,7 @@ def region_picker():
     '''
     Return a string of region name from users' manual pick
     '''
-    return Dropdown(options=GTA().region_names,
+    return Dropdown(options=load_gta().region_names + [ALL_REGIONS],
                     value='Southeast Asia',
                     description='Region',
                     disabled=False,
@@ -98,15 +210,19 @@ def region_picker():
                     )
 
 
+# color maps of the heatmap
+cmap_options = {'Aqua': 'cool',
+                'Lemon': 'Wistia',
+                'NYU Pride': 'Purples',
+                'Classic': 'RdBu_r'
+                }
+
+
 def Cmap_palette_picker():
     '''
     Return a string of color from users' manual pick
     '''
-    return Dropdown(options={'Aqua': 'cool',
-                             'Lemon': 'Wistia',
-                             'NYU Pride': 'Purples',
-                             'Classic': 'RdBu_r'
-                             },
+    return Dropdown(options=cmap_options,
                     value='RdBu_r',
                     description='Palette',
                     disabled=False,
@@ -114,14 +230,18 @@ def Cmap_palette_picker():
 
 
 
+# features of damages
+feature3_options = {'Deaths': 'kills',
+                    'Wounds': 'wounds',
+                    'Casualties': 'casualties'
+                    }
+
+
 def feature3_picker():
     '''
     Return a string of feature name from users' manual pick
     '''
-    return ToggleButtons(options={'Deaths': 'kills',
-                                  'Wounds': 'wounds',
-                                  'Casualties': 'casualties'
-                                  },
+    return ToggleButtons(options=feature3_options,
                          value='casualties',
                          description='Feature',
                          disabled=False,
@@ -129,12 +249,22 @@ def feature3_picker():
                          tooltip='Description')
 
 
-def Display_Your_Heatmap():
+def Display_Your_Heatmap(live=False):
     '''
     Allow users to interactively explore data information
-    and customize the heatmap
+    and customize the heatmap,
+    the rendered heatmaps are cached by figure_cache
+    ---
+    Parameter
+        - live: debounce the widgets and render in the background, see live   | bool
     '''
-    interact(Heatmap_by_region,
+    if live:
+        # imported here since the live layer renders with this module
+        import live as lv
+        return lv.Display_Your_Heatmap()
+    # imported here since the figure cache renders with this module
+    import figure_cache as fc
+    interact(fc.Heatmap_by_region,
              Region=region_picker(),
              Cmap = Cmap_palette_picker(),
              Feature = feature3_picker())
@@ -0,0 +1,221 @@
+'''
+This module is a responsive interaction layer for the widgets with long renders:
+    - the changes of the widgets are debounced, a render starts once they pause for DEBOUNCE_SECONDS
+    - the render runs in a background thread, the notebook stays responsive
+    - a render requested before a newer change is dropped, before it starts if it is queued,
+      and its output is discarded if it is already running
+    - only the output of the latest widget state is ever shown
+
+The renders go through figure_cache, so revisited and prefetched states are shown at once.
+
+Usage:
+    import heatmap as ht
+    ht.Display_Your_Heatmap(live=True)
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from IPython.display import display, Image, HTML
+from ipywidgets import Output, VBox
+
+import choropleth as cr
+import figure_cache as fc
+import Geo2D as geo
+import heatmap as ht
+from UserError import *
+
+
+# pause of the widgets before a render starts, in seconds
+DEBOUNCE_SECONDS = 0.3
+
+# errors of invalid widget states, shown as their message
+USER_ERRORS = (NoDataError, NoCountryDataError, NotIntervalError, IntervalReverseError, IntervalLeakError)
+
+
+class LatestRender(object):
+    '''
+    Attributes:
+        - self.render:     function computing the output of the widget values   | function
+        - self.show:       function showing an output                           | function
+        - self.delay:      debounce delay in seconds                            | float
+        - self.generation: number of the latest request
+        - self.shown, self.dropped: number of shown and dropped renders
+    Method:
+        - request the render of the widget values
+        - wait for the latest render
+    '''
+    def __init__(self, render, show, delay=DEBOUNCE_SECONDS):
+        self.render = render
+        self.show = show
+        self.delay = delay
+        self.generation = 0
+        self.shown = 0
+        self.dropped = 0
+        self._timer = None
+        self._future = None
+        # one render at a time, so the queued ones can be dropped before they start
+        self._executor = ThreadPoolExecutor(1)
+        self._lock = threading.Lock()
+
+    def request(self, **params):
+        '''
+        Request the render of the widget values, replacing the earlier requests
+        '''
+        with self._lock:
+            self.generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self._submit, (self.generation, params))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def is_stale(self, generation):
+        '''
+        Return whether a newer render has been requested   | bool
+        '''
+        return generation != self.generation
+
+    def _submit(self, generation, params):
+        '''
+        Queue the render once the widgets have paused
+        '''
+        with self._lock:
+            if not self.is_stale(generation):
+                self._future = self._executor.submit(self._compute, generation, params)
+
+    def _compute(self, generation, params):
+        '''
+        Render the widget values and show the output, unless it has become stale
+        '''
+        with self._lock:
+            if self.is_stale(generation):
+                self.dropped += 1
+                return
+        try:
+            output = self.render(**params)
+        except USER_ERRORS as error:
+            output = str(error)
+        except Exception:
+            output = traceback.format_exc()
+        with self._lock:
+            if self.is_stale(generation):
+                self.dropped += 1
+                return
+            self.show(output)
+            self.shown += 1
+
+    def wait(self):
+        '''
+        Wait until the latest requested render is shown or dropped,
+        waiting again if a newer render was requested meanwhile
+        '''
+        while True:
+            with self._lock:
+                generation, timer = self.generation, self._timer
+            if timer is not None:
+                timer.join()
+            # the timer has queued its render, if it was not cancelled
+            with self._lock:
+                future = self._future
+            if future is not None:
+                future.result()
+            with self._lock:
+                if generation == self.generation:
+                    return
+
+
+def show_in(out):
+    '''
+    Parameter
+        - out: output widget       | ipywidgets Output
+    Return
+        a function replacing the content of the widget by an output:
+        a text, or an object displayed by IPython                      | function
+    '''
+    def show(output):
+        out.clear_output(wait=True)
+        if isinstance(output, str):
+            out.append_stdout(output)
+        else:
+            out.append_display_data(output)
+    return show
+
+
+def interact_latest(render, delay=DEBOUNCE_SECONDS, **widgets):
+    '''
+    Parameters
+        - render  : function of the widget values, returning the output to show   | function
+        - delay   : debounce delay in seconds                                       | float
+        - widgets : widgets by parameter name of the render function                | ipywidgets
+    Return
+        the LatestRender of the widgets, after displaying them with their output
+    ---
+    The widgets update continuously, the debounce keeps the renders to the pauses
+    '''
+    out = Output()
+    latest = LatestRender(render, show_in(out), delay)
+
+    def update(change=None):
+        latest.request(**{name: widget.value for name, widget in widgets.items()})
+
+    for widget in widgets.values():
+        if hasattr(widget, 'continuous_update'):
+            widget.continuous_update = True
+        widget.observe(update, names='value')
+    display(VBox(list(widgets.values()) + [out]))
+    update()
+    return latest
+
+
+def density_output(Year, MapStyle):
+    '''
+    Return the 2D Geo Map of the widget values   | IPython Image
+    '''
+    return Image(data=fc.density_png(Year, MapStyle), format='png')
+
+
+def choropleth_output(Color, Feature, Year):
+    '''
+    Return the choropleth map of the widget values,
+    the explanation of the missing data of 1993      | IPython HTML or str
+    '''
+    if int(Year) == 1993:
+        return cr.NO_DATA_1993
+    return HTML(fc.choropleth_html(Color, Feature, Year))
+
+
+def heatmap_output(Feature, Region, Cmap):
+    '''
+    Return the heatmap of the widget values   | IPython Image
+    '''
+    return Image(data=fc.heatmap_png(Feature, Region, Cmap), format='png')
+
+
+def Display_Your_Geo2D_Map(delay=DEBOUNCE_SECONDS):
+    '''
+    Geo2D.Display_Your_Geo2D_Map, debounced and rendered in the background
+    '''
+    return interact_latest(density_output, delay,
+                           Year=geo.year_interval_slider(), MapStyle=geo.map_style_picker())
+
+
+def Display_Your_Choropleth(delay=DEBOUNCE_SECONDS):
+    '''
+    choropleth.Display_Your_Choropleth, debounced and rendered in the background
+    '''
+    return interact_latest(choropleth_output, delay,
+                           Year=cr.year_slider(), Feature=ht.feature3_picker(),
+                           Color=cr.color_palette_picker())
+
+
+def Display_Your_Heatmap(delay=DEBOUNCE_SECONDS):
+    '''
+    heatmap.Display_Your_Heatmap, debounced and rendered in the background
+    '''
+    return interact_latest(heatmap_output, delay,
+                           Region=ht.region_picker(), Cmap=ht.Cmap_palette_picker(),
+                           Feature=ht.feature3_picker())
@@ -0,0 +1,194 @@
+'''
+This module prefetches the neighbouring states of the year sliders:
+    - the slider values adjacent to the last render:
+        1. the year intervals one year wider or narrower of the 2D Geo Map
+        2. the previous and next year of the choropleth map
+        3. the next and previous 5-year period of the bubble chart
+    - a Prefetcher rendering them in a background thread into the figure cache,
+      so moving the slider there shows the stored image
+
+The prefetch stops when the user goes idle, yields to the renders the user asks for,
+never evicts the renders the user has seen, and keeps the prefetched renders
+not yet shown within a budget, replacing the oldest ones.
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import time
+import threading
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# years of the dataset, 1993 is missing from the Global Terrorism Database
+FIRST_YEAR = 1970
+LAST_YEAR = 2015
+MISSING_YEAR = 1993
+
+# the bubble chart slider, by 5-year periods
+FIRST_PERIOD = 1975
+PERIOD_STEP = 5
+
+# no prefetch once the user has not moved a widget for IDLE_SECONDS
+IDLE_SECONDS = 30
+
+# maximum number and total size of the prefetched renders not yet shown
+MAX_ENTRIES = 16
+MAX_BYTES = 64 * 2**20
+
+
+def adjacent_intervals(Year):
+    '''
+    Parameter
+        - Year: interval of the 2D Geo Map slider     | tuple
+    Return
+        the valid intervals one step away, moving the start first   | list
+    '''
+    start, end = int(Year[0]), int(Year[1])
+    intervals = [(start - 1, end), (start + 1, end), (start, end - 1), (start, end + 1)]
+    return [interval for interval in intervals
+            if FIRST_YEAR <= interval[0] < interval[1] <= LAST_YEAR]
+
+
+def adjacent_years(Year):
+    '''
+    Parameter
+        - Year: value of the choropleth slider     | int
+    Return
+        the previous and next years with data      | list
+    '''
+    return [year for year in (int(Year) - 1, int(Year) + 1)
+            if FIRST_YEAR <= year <= LAST_YEAR and year != MISSING_YEAR]
+
+
+def adjacent_periods(year):
+    '''
+    Parameter
+        - year: end of the 5-year period of the bubble chart slider     | int
+    Return
+        the next and previous periods, the next first                   | list
+    '''
+    return [period for period in (int(year) + PERIOD_STEP, int(year) - PERIOD_STEP)
+            if FIRST_PERIOD <= period <= LAST_YEAR]
+
+
+class Prefetcher(object):
+    '''
+    Attributes:
+        - self.cache:        FigureCache the renders are stored in
+        - self.max_entries:  maximum number of prefetched renders not yet shown
+        - self.max_bytes:    memory budget of the prefetched renders not yet shown
+        - self.idle_seconds: time without a request after which nothing is prefetched
+        - self.background:   context manager factory the renders run in,
+                             e.g. render.background to yield to the renders the user asked for
+        - self.prefetched:   size of the prefetched renders not yet shown, oldest first
+        - self.rendered, self.skipped: number of prefetched and skipped renders
+    Method:
+        - record a request of the user
+        - schedule the renders of the neighbouring states, replacing the pending ones
+    '''
+    def __init__(self, cache, workers=1, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 idle_seconds=IDLE_SECONDS, background=contextlib.nullcontext):
+        self.cache = cache
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.background = background
+        self.prefetched = OrderedDict()
+        self.rendered = 0
+        self.skipped = 0
+        self.last_request = time.time()
+        self._pending = []
+        self._executor = ThreadPoolExecutor(workers)
+        self._lock = threading.Lock()
+
+    def requested(self, key):
+        '''
+        Record that the user asked for the render of the key,
+        the renders of the previous neighbourhood that have not started are cancelled
+        '''
+        with self._lock:
+            self.last_request = time.time()
+            # a shown render is an ordinary entry of the cache
+            self.prefetched.pop(key, None)
+            self._cancel_pending()
+
+    def idle(self):
+        '''
+        Return whether the user has not asked for a render for idle_seconds   | bool
+        '''
+        return time.time() - self.last_request > self.idle_seconds
+
+    def _cancel_pending(self):
+        '''
+        Cancel the renders that have not started, the lock being held
+        '''
+        for future in self._pending:
+            future.cancel()
+        self._pending = []
+
+    def _trim(self):
+        '''
+        Remove the oldest prefetched renders not yet shown until they fit in the budget,
+        the lock being held
+        '''
+        for key in [key for key in self.prefetched if key not in self.cache]:
+            del self.prefetched[key]
+        while self.prefetched and (len(self.prefetched) > self.max_entries
+                                   or sum(self.prefetched.values()) > self.max_bytes):
+            key, _ = self.prefetched.popitem(last=False)
+            self.cache.discard_unshown(key)
+
+    def schedule(self, jobs):
+        '''
+        Parameter
+            - jobs: (key, function rendering the output) of the neighbouring states,
+                    the most likely first                                            | list
+        '''
+        with self._lock:
+            self._cancel_pending()
+            self._pending = [self._executor.submit(self._prefetch, key, render_output)
+                             for key, render_output in jobs]
+
+    def wait(self):
+        '''
+        Wait for the scheduled renders
+        '''
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            if not future.cancelled():
+                future.result()
+
+    def _prefetch(self, key, render_output):
+        '''
+        Render the output of the key into the cache, unless the user is idle
+        or the output is already cached, and keep the prefetched renders within the budget
+        '''
+        if self.idle() or key in self.cache:
+            with self._lock:
+                self.skipped += 1
+            return
+        try:
+            with self.background():
+                output = self.cache.prefetch(key, render_output)
+        except Exception:
+            # the errors are shown when the user asks for the state
+            output = None
+        with self._lock:
+            if output is None:
+                self.skipped += 1
+            else:
+                self.prefetched[key] = len(output)
+                self.rendered += 1
+                self._trim()
+
+    def shutdown(self):
+        '''
+        Cancel the pending renders and stop the threads
+        '''
+        with self._lock:
+            self._cancel_pending()
+        self._executor.shutdown()
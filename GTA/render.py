@@ -0,0 +1,188 @@
+'''
+This module renders the visualizations headless, without a notebook or widgets:
+    - the functions take the same parameters as the interactive ones
+    - they return the PNG or SVG bytes of the figure,
+      or the html of the choropleth map
+    - the figures are drawn on the Agg canvas, outside of pyplot,
+      so worker processes of a web backend need no display
+
+One figure is kept per chart and size and cleared between calls,
+one figure is drawn at a time since matplotlib is not thread-safe,
+the renders the user asked for go before the background ones (see background).
+
+Usage:
+    import render
+    png = render.render_heatmap_by_region('casualties', 'South Asia', 'RdBu_r')
+    svg = render.render_dot_plot('occurrences', 'Armed Assault', (1990, 2000), fmt='svg')
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import io
+import threading
+import contextlib
+import seaborn as sns
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import AnalysisAndLinePlot as al
+import bubble_chart as bc
+import choropleth as cr
+import dot_plot as dot
+import Geo2D as geo
+import heatmap as ht
+from UserError import *
+
+
+# image formats of the rendered figures and their content types
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+DPI = 100
+
+# figures kept between calls, by (chart, figure size)
+_figures = {}
+
+# whether a figure is being drawn, and the number of foreground renders waiting to draw
+_condition = threading.Condition()
+_drawing_state = {'busy': False, 'waiting': 0}
+
+# whether the renders of the current thread are background ones
+_thread = threading.local()
+
+
+@contextlib.contextmanager
+def background():
+    '''
+    Run the renders of the block in the background, e.g. the prefetch of neighbouring states:
+    they only draw when no render the user asked for is waiting
+    '''
+    _thread.background = True
+    try:
+        yield
+    finally:
+        _thread.background = False
+
+
+@contextlib.contextmanager
+def _drawing():
+    '''
+    Hold the figures while drawing, the foreground renders going first
+    '''
+    foreground = not getattr(_thread, 'background', False)
+    with _condition:
+        if foreground:
+            _drawing_state['waiting'] += 1
+        try:
+            _condition.wait_for(lambda: not _drawing_state['busy']
+                                and (foreground or not _drawing_state['waiting']))
+        finally:
+            if foreground:
+                _drawing_state['waiting'] -= 1
+        _drawing_state['busy'] = True
+    try:
+        yield
+    finally:
+        with _condition:
+            _drawing_state['busy'] = False
+            _condition.notify_all()
+
+
+def _figure_axes(chart, figsize):
+    '''
+    Return the (figure, axes) of the chart, reusing the figure of an earlier call:
+    the single axes are cleared, a figure with more axes (e.g. a colorbar) is cleared entirely
+    '''
+    fig = _figures.get((chart, figsize))
+    if fig is None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        _figures[(chart, figsize)] = fig
+    if len(fig.axes) == 1:
+        ax = fig.axes[0]
+        ax.clear()
+    else:
+        fig.clf()
+        ax = fig.add_subplot(1, 1, 1)
+    return fig, ax
+
+
+def render_figure(chart, figsize, draw, fmt='png', dpi=DPI, style=None):
+    '''
+    Parameters
+        - chart   : name of the chart, the key of the reused figure    | str
+        - figsize : size of the figure in inches                       | tuple
+        - draw    : function drawing on the axes                       | function
+        - fmt     : 'png' or 'svg'                                     | str
+        - dpi     : resolution of the png                              | int
+        - style   : seaborn style of the figure, unchanged if None     | str
+    Return
+        the image of the figure                                        | bytes
+    '''
+    if fmt not in FORMATS:
+        raise ValueError('The format must be one of {}.'.format(', '.join(sorted(FORMATS))))
+    # the style only applies to this figure, the global seaborn style is unchanged
+    with _drawing(), sns.axes_style(style):
+        fig, ax = _figure_axes(chart, tuple(figsize))
+        draw(ax)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def render_2D_density(Year, MapStyle, fmt='png', dpi=DPI):
+    '''
+    Return the image of the 2D Geo Map of plot_2D_density   | bytes
+    '''
+    geo.check_year_interval(Year)
+    lon, lat = geo.interval_coordinates(Year)
+    return render_figure('density', (18, 10),
+                         lambda ax: geo.draw_2D_density(lon, lat, Year, MapStyle, ax), fmt, dpi)
+
+
+def render_heatmap_by_region(Feature, Region, Cmap, fmt='png', dpi=DPI):
+    '''
+    Return the image of the heatmap of Heatmap_by_region   | bytes
+    '''
+    pivot_table = ht.region_pivot(Region, Feature)
+    fast = ht.use_fast_heatmap(pivot_table)
+    return render_figure('heatmap', (25, ht.heatmap_height(Region, fast)),
+                         lambda ax: ht.draw_heatmap(pivot_table, Feature, Region, Cmap, ax, fast), fmt, dpi)
+
+
+def render_dot_plot(metric, attacktype, year_range, fmt='png', dpi=DPI):
+    '''
+    Return the image of the dot plot of create_dot_plot   | bytes
+    '''
+    return render_figure('dot_plot', (6, 12),
+                         lambda ax: dot.draw_dot_plot(metric, attacktype, year_range, ax),
+                         fmt, dpi, style='whitegrid')
+
+
+def render_bubble_chart(year, fmt='png', dpi=DPI):
+    '''
+    Return the image of the bubble chart of create_bubble_chart   | bytes
+    '''
+    frame = bc.bubble_chart.get_frame(bc.construct_interval(year))
+    return render_figure('bubble_chart', (18.5, 10.5),
+                         lambda ax: bc.bubble_chart.draw_frame(frame, ax), fmt, dpi)
+
+
+def render_analy_and_plot(Country, Feature, Color, Horizon=0, fmt='png', dpi=DPI):
+    '''
+    Return the image of the line plot of analy_and_plot,
+    the statistical analysis is given by AnalysisAndLinePlot.analy_ctr   | bytes
+    '''
+    if Country not in al.gtd_country_names():
+        raise NoCountryDataError
+    return render_figure('line_plot', (15, 5),
+                         lambda ax: al.draw_line_plot(Country, Feature, Color, ax, Horizon=Horizon),
+                         fmt, dpi, style='whitegrid')
+
+
+def render_choropleth(Color, Feature, Year):
+    '''
+    Return the html page of the choropleth map of plot_choropleth   | str
+    '''
+    if int(Year) == 1993 or int(Year) not in range(1970, 2016):
+        raise NoDataError
+    return cr.make_choropleth_map(Color, Feature, int(Year)).get_root().render()
@@ -0,0 +1,378 @@
+'''
+This module serves the analyses as JSON over HTTP, for the dashboards on this machine:
+    - /stats       statistical report of a country                 (country)
+    - /pivot       country x year values of a region               (region, feature)
+    - /topk        top countries by attack type and year range     (metric, attacktype, start, end, k)
+    - /choropleth  totals of every country of the map in a year    (year, feature)
+    - /metrics     requests, cache hits and latencies of every endpoint
+
+The dataset is aggregated once when the server starts,
+the queries run in the server's own thread pool, at most max_concurrency at a time,
+a query taking more than timeout seconds is answered with 504,
+and the responses are cached by endpoint and normalized parameters.
+The server is bound to 127.0.0.1 by default.
+
+Usage (from the GTA directory):
+    python server.py --port 8765
+    curl 'http://127.0.0.1:8765/topk?metric=casualties&attacktype=Armed%20Assault&start=1990&end=2000'
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+import AnalysisAndLinePlot as al
+import choropleth as cr
+import dot_plot as dot
+import heatmap as ht
+from UserError import *
+
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# number of latencies kept per endpoint for the percentiles
+LATENCY_WINDOW = 1000
+
+# seconds a query may take before the request is answered with 504
+REQUEST_TIMEOUT = 30
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error', 504: 'Gateway Timeout'}
+
+
+def country_stats_query(country):
+    '''
+    Return the statistical report of the country, as AnalysisAndLinePlot.country_report   | dict
+    '''
+    profiles = al.country_profiles()
+    if country not in profiles.countries:
+        raise NoCountryDataError
+    return al.country_report(country, profiles)
+
+
+def region_pivot_query(region, feature):
+    '''
+    Return the country x year values of the region, as heatmap.region_pivot   | dict
+    '''
+    if region not in ht.load_gta().region_names + [ht.ALL_REGIONS]:
+        raise QueryError('Unknown region: {}'.format(region))
+    if feature not in ht.feature3_options.values():
+        raise QueryError('The feature must be one of {}.'.format(', '.join(sorted(ht.feature3_options.values()))))
+    pivot_table = ht.region_pivot(region, feature)
+    return {'region': region,
+            'feature': feature,
+            'countries': list(pivot_table.index),
+            'years': [int(year) for year in pivot_table.columns],
+            'values': pivot_table.values.astype(float).tolist()}
+
+
+def top_k_query(metric, attacktype, start, end, k):
+    '''
+    Return the k countries with the largest totals, as dot_plot.Dot_Plot_TopK.top_k   | dict
+    '''
+    topk = dot.dot_plot_topk()
+    if metric not in topk.cumulative:
+        raise QueryError('The metric must be one of {}.'.format(', '.join(sorted(topk.cumulative))))
+    if attacktype not in topk.attacktypes:
+        raise QueryError('Unknown attack type: {}'.format(attacktype))
+    if start > end:
+        raise IntervalReverseError
+    if not 0 < k <= len(topk.countries):
+        raise QueryError('k must be between 1 and {}.'.format(len(topk.countries)))
+    top = topk.top_k(metric, attacktype, (start, end), k)
+    return {'metric': metric,
+            'attacktype': attacktype,
+            'years': [start, end],
+            'top': [{'country': country, 'value': float(value)} for country, value in top.values]}
+
+
+def choropleth_query(year, feature):
+    '''
+    Return the chosen feature of every country of the map in the year,
+    as choropleth.ChoroplethMatrix.year_data, null if there was no attack   | dict
+    '''
+    if year == 1993 or year not in range(1970, 2016):
+        raise NoDataError
+    if feature not in cr.FEATURES:
+        raise QueryError('The feature must be one of {}.'.format(', '.join(cr.FEATURES)))
+    matrix = cr.choropleth_matrix()
+    year_data = matrix.year_data(year, feature)
+    values = year_data[feature].values.astype(float)
+    return {'year': year,
+            'feature': feature,
+            'scale_max': matrix.scale_max(year, feature),
+            'values': dict(zip(year_data.country, [None if value == -99 else value for value in values.tolist()]))}
+
+
+def _text(value):
+    '''
+    Return the value without surrounding whitespace
+    '''
+    return value.strip()
+
+
+def _lower(value):
+    '''
+    Return the value in lower case without surrounding whitespace
+    '''
+    return value.strip().lower()
+
+
+# query function and (converter, default) of every parameter of the endpoints,
+# parameters without a default are required
+ENDPOINTS = {
+    '/stats': (country_stats_query, OrderedDict([('country', (_text, None))])),
+    '/pivot': (region_pivot_query, OrderedDict([('region', (_text, None)),
+                                                ('feature', (_lower, 'casualties'))])),
+    '/topk': (top_k_query, OrderedDict([('metric', (_lower, 'casualties')),
+                                        ('attacktype', (_text, None)),
+                                        ('start', (int, 1970)),
+                                        ('end', (int, 2015)),
+                                        ('k', (int, 20))])),
+    '/choropleth': (choropleth_query, OrderedDict([('year', (int, None)),
+                                                   ('feature', (_lower, 'casualties'))])),
+}
+
+
+def normalize_params(path, query):
+    '''
+    Parameters
+        - path  : endpoint                         | str
+        - query : parameters of the url            | dict
+    Return
+        the converted parameters of the endpoint, in the order of its query function,
+        with the defaults of the missing ones; unknown parameters are ignored   | tuple
+    '''
+    params = []
+    for name, (convert, default) in ENDPOINTS[path][1].items():
+        if name not in query:
+            if default is None:
+                raise QueryError('Missing parameter: {}'.format(name))
+            params.append(default)
+            continue
+        try:
+            params.append(convert(query[name]))
+        except ValueError:
+            raise QueryError('Invalid value of {}: {}'.format(name, query[name]))
+    return tuple(params)
+
+
+def error_status(error):
+    '''
+    Return the http status of an error raised by a query   | int
+    '''
+    if isinstance(error, (NoDataError, NoCountryDataError)):
+        return 404
+    if isinstance(error, (QueryError, NotIntervalError, IntervalReverseError, IntervalLeakError)):
+        return 400
+    if isinstance(error, asyncio.TimeoutError):
+        return 504
+    return 500
+
+
+class EndpointMetrics(object):
+    '''
+    Attributes:
+        - self.requests:   number of requests
+        - self.errors:     number of responses with an error status
+        - self.cache_hits: number of responses served by the cache
+        - self.latencies:  the last LATENCY_WINDOW latencies, in seconds
+    Method:
+        - summarize the metrics as a dict
+    '''
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, seconds, status, cached):
+        '''
+        Record one response
+        '''
+        self.requests += 1
+        self.errors += status != 200
+        self.cache_hits += cached
+        self.latencies.append(seconds)
+
+    def summary(self):
+        '''
+        Return the counts and the latency percentiles in milliseconds   | dict
+        '''
+        summary = {'requests': self.requests, 'errors': self.errors, 'cache_hits': self.cache_hits}
+        if self.latencies:
+            latencies = np.array(self.latencies) * 1000
+            summary.update({'mean_ms': float(latencies.mean()),
+                            'p50_ms': float(np.percentile(latencies, 50)),
+                            'p95_ms': float(np.percentile(latencies, 95)),
+                            'max_ms': float(latencies.max())})
+        return summary
+
+
+class QueryServer(object):
+    '''
+    Attributes:
+        - self.host, self.port: address of the server, the port is chosen by the system if 0
+        - self.cache:           LRU cache of the response bodies, by endpoint and normalized parameters
+        - self.metrics:         EndpointMetrics of every endpoint
+        - self.timeout:         seconds a query may take before it is answered with 504
+    Method:
+        - load the data, start and close the server
+        - answer a query
+    '''
+    def __init__(self, host=HOST, port=PORT, max_concurrency=4, cache_size=256, timeout=REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.metrics = {path: EndpointMetrics() for path in list(ENDPOINTS) + ['/metrics']}
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._executor = None
+        self._server = None
+
+    @staticmethod
+    def load():
+        '''
+        Aggregate the dataset for every endpoint, once
+        '''
+        al.country_profiles()
+        ht.region_totals()
+        dot.dot_plot_topk()
+        cr.choropleth_matrix()
+
+    async def start(self):
+        '''
+        Load the data in the thread pool and start listening
+        '''
+        loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(self.max_concurrency)
+        await loop.run_in_executor(self._executor, self.load)
+        self._server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        '''
+        Stop listening
+        '''
+        self._server.close()
+        await self._server.wait_closed()
+        self._executor.shutdown()
+
+    async def query(self, path, query):
+        '''
+        Parameters
+            - path  : endpoint                  | str
+            - query : parameters of the url     | dict
+        Return
+            (http status, json body, whether it came from the cache)   | tuple
+        '''
+        if path == '/metrics':
+            return 200, self.metrics_body(), False
+        if path not in ENDPOINTS:
+            return 404, json.dumps({'error': 'Unknown endpoint: {}'.format(path)}).encode(), False
+        try:
+            key = (path,) + normalize_params(path, query)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return 200, self.cache[key], True
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                # the thread of a query that timed out runs on, its result is discarded
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, ENDPOINTS[path][0], *key[1:]), self.timeout)
+        except Exception as error:
+            return error_status(error), json.dumps({'error': str(error).strip()}).encode(), False
+        body = json.dumps(result).encode()
+        self.cache[key] = body
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return 200, body, False
+
+    def metrics_body(self):
+        '''
+        Return the metrics of every endpoint and the cache as a json body   | bytes
+        '''
+        return json.dumps({'endpoints': {path: metrics.summary() for path, metrics in self.metrics.items()},
+                           'cache': {'entries': len(self.cache), 'max_entries': self.cache_size}}).encode()
+
+    async def handle(self, reader, writer):
+        '''
+        Answer one http request of a connection
+        '''
+        start = time.time()
+        path, cached = None, False
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            # skip the headers
+            while (await reader.readline()).strip():
+                pass
+            if len(request_line) < 2:
+                status, body = 400, json.dumps({'error': 'Malformed request'}).encode()
+            elif request_line[0] != 'GET':
+                status, body = 405, json.dumps({'error': 'Only GET is supported'}).encode()
+            else:
+                url = urlsplit(request_line[1])
+                path = url.path.rstrip('/') or '/'
+                status, body, cached = await self.query(path, dict(parse_qsl(url.query)))
+        except Exception as error:
+            status, body = 500, json.dumps({'error': str(error).strip()}).encode()
+
+        try:
+            writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                         'Connection: close\r\n\r\n'.format(status, STATUS_TEXT[status], len(body)).encode())
+            writer.write(body)
+            await writer.drain()
+        except ConnectionError:
+            # the client has gone, there is nobody to answer
+            pass
+        finally:
+            writer.close()
+        if path in self.metrics:
+            self.metrics[path].record(time.time() - start, status, cached)
+
+
+def parse_args(argv):
+    '''
+    Return the parsed command line arguments
+    '''
+    parser = argparse.ArgumentParser(description='Serve the Global Terrorism Analysis queries as JSON.')
+    parser.add_argument('--host', default=HOST, help='address to bind (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--concurrency', type=int, default=4, help='queries computed at the same time')
+    parser.add_argument('--cache-size', type=int, default=256, help='number of cached responses')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                        help='seconds a query may take before it is answered with 504')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    server = QueryServer(args.host, args.port, args.concurrency, args.cache_size, args.timeout)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(server.start())
+    print('Serving on http://{}:{}'.format(server.host, server.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
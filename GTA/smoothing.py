@@ -0,0 +1,43 @@
+'''
+This module smooths the yearly series of the line plots:
+    - precomputes the cubic spline basis of a fixed grid of years once
+    - smooths one series, or the series of all countries at once,
+      with a single matrix multiplication
+
+The cubic spline through the points of a series is linear in the values of the series,
+so the spline of every series is a combination of the splines of the unit series.
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+
+class SplineSmoother(object):
+    '''
+    Attributes:
+        - self.x:        the years of the series
+        - self.x_smooth: the points of the smooth line
+        - self.basis:    values of the spline of every unit series on x_smooth,
+                         a len(x_smooth) x len(x) matrix
+    Method:
+        - smooth one series or a matrix of series
+    '''
+    def __init__(self, x, n_points=500):
+        self.x = np.asarray(x, dtype=float)
+        self.x_smooth = np.linspace(self.x.min(), self.x.max(), n_points)
+        self.basis = CubicSpline(self.x, np.eye(len(self.x)), axis=0)(self.x_smooth)
+
+    def smooth(self, y):
+        '''
+        Parameter
+            - y: one series of len(x) values, or one series per row   | np.array
+        Return
+            the smooth line(s) on x_smooth                            | np.array
+        '''
+        y = np.asarray(y, dtype=float)
+        if y.shape[-1] != len(self.x):
+            raise ValueError('Expected series of {} values, got {}.'.format(len(self.x), y.shape[-1]))
+        return y.dot(self.basis.T)
@@ -7,14 +7,33 @@ This module tests:
 Module Authors: Xianzhi Cao (xc965) & Caroline Roper (cer446)
 '''
 
+import os
+import json
+import time
+import contextlib
+import threading
+import tempfile
+import asyncio
 import unittest
 import pandas as pd
 import numpy as np
+import seaborn as sns
 import util as ut
 import AnalysisAndLinePlot as al
 import choropleth as cr
 import heatmap as ht
 import Geo2D as geo
+import geo_simplify as gs
+import trends
+import anomaly
+import forecast
+import batch
+import render
+import server
+import figure_cache as fc
+import disk_cache
+import prefetch
+import live
 from data import *
 from UserError import *
 from dot_plot import *
@@ -108,6 +127,36 @@ class UserTest(unittest.TestCase):
         sum1 = sum(armedassault_80_90['casualties'])
         self.assertEqual(sum1, sum(self.test_dot_plot.data))
 
+    def test_dot_plot_top_k(self):
+        '''Tests whether the top-k engine gives the same totals as the unstacked Dot_Plot_Data'''
+        topk = Dot_Plot_TopK(self.test_dot_plot_data)
+        self.test_dot_plot.user_selection((1980,1990), 'Armed Assault')
+        self.test_dot_plot.aggregate()
+        self.test_dot_plot.convert_series('Casualties from Armed Assault')
+        self.test_dot_plot.take_top_20()
+        expected = self.test_dot_plot.data.set_index('country')['Casualties from Armed Assault']
+        top_20 = topk.top_k('casualties', 'Armed Assault', (1980,1990))
+        self.assertEqual(['country', 'Casualties from Armed Assault'], list(top_20.columns))
+        self.assertEqual(list(expected.values), list(top_20['Casualties from Armed Assault']))
+
+        occurrences = topk.totals('occurrences', ['Armed Assault'], (1980,1990))[0]
+        data = self.test_dot_plot_data
+        selected = data[(data.year >= 1980) & (data.year <= 1990) & (data.attacktype == 'Armed Assault')]
+        self.assertEqual(len(selected), occurrences.sum())
+        self.assertEqual(5, len(topk.top_k('occurrences', 'Armed Assault', (1980,1990), k=5)))
+
+    def test_dot_plot_top_k_many(self):
+        '''Tests whether the comparison of several attack types and metrics agrees with single queries'''
+        topk = Dot_Plot_TopK(self.test_dot_plot_data)
+        attack_types = ['Armed Assault', 'Bombing/Explosion']
+        top = topk.top_k_many(['occurrences', 'casualties'], attack_types, (1975, 1985), k=5)
+        self.assertEqual(['metric', 'attacktype', 'rank', 'country', 'value'], list(top.columns))
+        self.assertEqual(2 * 2 * 5, len(top))
+        single = topk.top_k('casualties', 'Bombing/Explosion', (1975, 1985), k=5)
+        facet = top[(top.metric == 'casualties') & (top.attacktype == 'Bombing/Explosion')]
+        self.assertEqual(list(single.iloc[:, 1]), list(facet['value']))
+        self.assertEqual([1, 2, 3, 4, 5], list(facet['rank']))
+
     def test_sum_by_groups(self):
         '''Tests whether sum_by_groups produces a dataframe with a row for each group and the total is accurate'''
         grouped_test_data = sum_by_groups(group_by_columns(self.test_data, ['Height', 'Weight'], 'a'))
@@ -120,6 +169,51 @@ class UserTest(unittest.TestCase):
         self.assertEqual(grouped_test_data.shape, (8, 1))
         self.assertEqual(len(self.test_data), sum(grouped_test_data['count']))
 
+    def test_aggregate_chunks(self):
+        '''Tests whether the sums and counts by groups folded from chunks of a csv file are identical to the in-memory ones'''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'selected.csv')
+            self.data_creation.gt_df[0:5000].to_csv(path, index=False)
+            whole = pd.read_csv(path)
+            sums, counts = stream_group_aggregates(['region', 'year'], 'casualties', path, chunksize=700)
+        grouped = group_by_columns(whole, ['region', 'year'], 'casualties')
+        pd.testing.assert_frame_equal(sum_by_groups(grouped), sums)
+        pd.testing.assert_frame_equal(count_by_groups(grouped), counts)
+
+        # a missing year in one chunk makes the years of the whole file floats
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'selected.csv')
+            gt_df = self.data_creation.gt_df[0:5000].copy()
+            gt_df.loc[gt_df.index[2000], 'year'] = np.nan
+            gt_df.to_csv(path, index=False)
+            whole = pd.read_csv(path)
+            sums, counts = stream_group_aggregates(['region', 'year'], 'casualties', path, chunksize=700)
+        grouped = group_by_columns(whole, ['region', 'year'], 'casualties')
+        pd.testing.assert_frame_equal(sum_by_groups(grouped), sums)
+        pd.testing.assert_frame_equal(count_by_groups(grouped), counts)
+
+        chunks = [self.test_data[i:i + 3].copy() for i in range(0, 10, 3)]
+        sums, counts = aggregate_chunks(chunks, ['Height', 'Weight'], 'Container')
+        grouped = group_by_columns(self.test_data, ['Height', 'Weight'], 'Container')
+        pd.testing.assert_frame_equal(sum_by_groups(grouped), sums)
+        pd.testing.assert_frame_equal(count_by_groups(grouped), counts)
+
+        # a chunk without any year only makes the casualties of the whole file floats
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'selected.csv')
+            gt_df = self.data_creation.gt_df[0:2100][['region', 'year', 'casualties']].copy()
+            gt_df['casualties'] = gt_df['casualties'].fillna(0)
+            gt_df.loc[gt_df.index[1400:], 'year'] = np.nan
+            gt_df.loc[gt_df.index[1500], 'casualties'] = np.nan
+            # written as integers, with empty fields for the missing values
+            gt_df[['year', 'casualties']] = gt_df[['year', 'casualties']].astype('Int64')
+            gt_df.to_csv(path, index=False)
+            whole = pd.read_csv(path)
+            sums, counts = stream_group_aggregates(['region', 'year'], 'casualties', path, chunksize=700)
+        grouped = group_by_columns(whole, ['region', 'year'], 'casualties')
+        pd.testing.assert_frame_equal(sum_by_groups(grouped), sums)
+        pd.testing.assert_frame_equal(count_by_groups(grouped), counts)
+
     def test_unstack_table(self):
         '''Tests whether unstack_table produces a result with the appropriate shape'''
         grouped_test = sum_by_groups(group_by_columns(self.test_data, ['Height', 'Weight'], 'a'))
@@ -153,6 +247,8 @@ class UserTest(unittest.TestCase):
         '''verifies that add_color_dict adds new column 'color' with no nulls'''
         self.test_bubble_chart.add_color_dict()
         self.assertEqual(self.test_bubble_chart.new_data['color'].isnull().sum(), 0)
+        with self.assertRaises(KeyError):
+            self.test_bubble_chart.color_values(pd.Series(['Atlantis']))
 
     def test_process_bubble_chart_data(self):
         '''verifies that process_bubble_chart_data correctly calculates the all-time occurrences bubble size'''
@@ -160,6 +256,30 @@ class UserTest(unittest.TestCase):
         subset = self.test_bubble_chart.new_data.reset_index()[['country', 'all-time occurrences']]
         self.assertEqual(sum(subset.drop_duplicates()['all-time occurrences']), len(self.test_bubble_chart.data))
 
+    def test_create_legend(self):
+        '''verifies that the legend and the labels agree with the color column and the largest bubbles'''
+        self.test_bubble_chart.process_bubble_chart_data('occurrences', 'casualties')
+        new_data = self.test_bubble_chart.new_data
+        legend = self.test_bubble_chart.create_legend()
+        self.assertEqual(sorted(new_data['region'].unique()), list(legend.keys()))
+        first = new_data.iloc[0]
+        self.assertEqual(cm.viridis(first['color']), legend[first['region']])
+        names, x, y, offsets = self.test_bubble_chart.top_k(3)
+        self.assertEqual(sorted(new_data['casualties'], reverse=True)[:3], list(y))
+        self.assertEqual((3, 2), offsets.shape)
+
+    def test_precompute_frames(self):
+        '''verifies that the precomputed frames agree with the aggregated data and leave new_data untouched'''
+        frames = self.test_bubble_chart.precompute_frames('occurrences', 'casualties')
+        self.assertIs(self.test_bubble_chart.data, self.test_bubble_chart.new_data)
+        self.assertEqual(sorted(self.test_bc_data['attacktype'].unique()), sorted(frames.keys()))
+        self.assertEqual(len(self.test_bc_data), sum(sum(frame.x) for frame in frames.values()))
+        frame = self.test_bubble_chart.get_frame(sorted(frames)[0])
+        self.assertTrue((np.diff(frame.y) <= 0).all())
+        self.assertEqual(list(frame.bubble_ids[:len(frame.labels)]), list(frame.labels))
+        self.assertEqual(0, frame.x_limit % 750)
+        self.assertFalse(frame.x.flags.writeable)
+
     def test_df_occur_by_ctr(self):
         '''
         test the df_occur_by_ctr function in AnalysisAndLinePlot module
@@ -243,6 +363,49 @@ class UserTest(unittest.TestCase):
         self.assertIn('25%', al.ctr_stats('Austria').columns.values)
 
 
+    def test_country_profiles(self):
+        '''
+        test whether the CountryProfiles class in AnalysisAndLinePlot module
+        gives the same yearly series and statistics as grouping the country's data
+        '''
+        profiles = al.CountryProfiles(self.data_creation.gt_df)
+        self.assertEqual(al.gtd_country_names(), profiles.countries)
+        japan = profiles.country_series('Japan')
+        self.assertEqual(['year', 'kills', 'wounds', 'casualties', 'occurrences'], list(japan.columns))
+        self.assertEqual(45, len(japan))
+        occurrences = al.drop93(al.df_occur_by_ctr_allyears('Japan'))
+        self.assertEqual(list(occurrences.occurrences), list(japan.occurrences))
+        gt_df = self.data_creation.gt_df
+        self.assertEqual(gt_df[gt_df.country == 'Japan'].kills.sum(), japan.kills.sum())
+
+        stats = profiles.country_stats('Japan')
+        expected = japan.describe().T
+        self.assertEqual(list(expected.index), list(stats.index))
+        for column in expected.columns:
+            self.assertTrue(np.allclose(expected[column], stats[column]))
+        self.assertEqual(len(gt_df), profiles.country_stats('The Whole World').loc['occurrences', 'sum'])
+
+
+    def test_smoothing(self):
+        '''
+        test the smooth lines in AnalysisAndLinePlot module
+        whether the smooth line goes through the yearly values
+        and the batched smoothing agrees with smoothing one country
+        '''
+        smoother = al.year_smoother()
+        self.assertEqual(500, len(smoother.x_smooth))
+        y = al.df_ctr_all('Peru').casualties.values
+        y_smooth = al.smoothed_series('Peru', 'casualties')
+        self.assertTrue(np.allclose(y_smooth[[0, -1]], y[[0, -1]]))
+        self.assertIs(y_smooth, al.smoothed_series('Peru', 'casualties'))
+
+        all_smooth = al.smooth_all('casualties')
+        self.assertEqual((207, 500), all_smooth.shape)
+        self.assertTrue(np.allclose(y_smooth, all_smooth.loc['Peru'].values))
+        with self.assertRaises(ValueError):
+            smoother.smooth(np.zeros(46))
+
+
     def test_analy_ctr(self):
         '''
         test whether the analy_ctr function in AnalysisAndLinePlot module
@@ -294,6 +457,25 @@ class UserTest(unittest.TestCase):
         self.assertEqual(-99, chr_t2.all_ctr_dam().wounds[chr_t2.all_ctr_dam().country == 'United Arab Emirates'].tolist()[0])
 
 
+    def test_choropleth_matrix(self):
+        '''
+        test whether the ChoroplethMatrix class in the choropleth module
+        gives the same data as the Choropleth class
+        '''
+        matrix = cr.ChoroplethMatrix(self.data_creation.gt_df)
+        self.assertEqual(sorted(cr.FEATURES), sorted(matrix.matrices.keys()))
+        self.assertEqual(6900, matrix.scale_max(2011, 'casualties'))
+        self.assertEqual(7000, matrix.scale_max(2012, 'wounds'))
+
+        expected = cr.Choropleth(Year=2012, Feature='wounds').all_ctr_dam().set_index('country').wounds
+        year_data = matrix.year_data(2012, 'wounds').set_index('country').wounds
+        self.assertEqual((180,), year_data.shape)
+        self.assertTrue((expected.loc[year_data.index] == year_data).all())
+        self.assertEqual(-99, year_data.loc['United Arab Emirates'])
+        # no data in 1993
+        self.assertTrue((matrix.year_data(1993, 'kills').kills == -99).all())
+
+
     def test_find_js_country_names(self):
         '''
         test the find_js_country_names function in the choropleth module
@@ -310,6 +492,52 @@ class UserTest(unittest.TestCase):
         self.assertEqual('country', cr.js_country_names().columns.any())
 
 
+    def test_simplify_geojson(self):
+        '''
+        test the simplify_geojson function in the geo_simplify module
+        whether all the countries are kept with fewer points
+        and the end points of every shared border are preserved
+        '''
+        geo = load_json_file('countries.geo.json')
+        simplified = gs.simplify_geojson(geo, 0.5, 3)
+        self.assertEqual(len(geo['features']), len(simplified['features']))
+        n_points = lambda g: sum(len(r) for f in g['features'] for r in gs._rings(f['geometry']))
+        self.assertLess(n_points(simplified), n_points(geo) / 2)
+        # every junction of three borders is still on the map
+        points = set(tuple(p) for f in simplified['features'] for r in gs._rings(f['geometry']) for p in r)
+        junctions = set((round(p[0], 3), round(p[1], 3)) for p in gs.find_junctions(geo))
+        self.assertEqual(set(), junctions - points)
+
+
+    def test_geo_path_for_zoom(self):
+        '''
+        test the level_for_zoom function in the geo_simplify module
+        '''
+        self.assertEqual('low', gs.level_for_zoom(2))
+        self.assertEqual('medium', gs.level_for_zoom(5))
+        self.assertEqual('high', gs.level_for_zoom(10))
+        self.assertEqual('countries.geo.low.json', gs.simplified_path('low'))
+
+
+    def test_save_simplified_geojson(self):
+        '''
+        test the save_simplified_geojson function in the geo_simplify module
+        whether the chosen geo json file is simplified
+        '''
+        square = {'type': 'FeatureCollection',
+                  'features': [{'type': 'Feature', 'id': 'SQR', 'properties': {'name': 'Square'},
+                                'geometry': {'type': 'Polygon',
+                                             'coordinates': [[[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]]}}]}
+        with tempfile.TemporaryDirectory() as tmp:
+            geo_path = os.path.join(tmp, 'square.geo.json')
+            with open(geo_path, 'w') as json_file:
+                json.dump(square, json_file)
+            paths = gs.save_simplified_geojson(geo_path)
+            self.assertEqual(os.path.join(tmp, 'square.geo.low.json'), paths['low'])
+            with open(paths['low']) as json_file:
+                self.assertEqual(['Square'], [f['properties']['name'] for f in json.load(json_file)['features']])
+
+
     def test_plot_choropleth(self):
         '''
         test the plot_choropleth function in the choropleth module
@@ -322,6 +550,341 @@ class UserTest(unittest.TestCase):
             cr.plot_choropleth(Color='Blues', Feature='kills', Year=1919)
 
 
+    def test_choropleth_jobs(self):
+        '''
+        test the choropleth_jobs function in the batch module
+        whether every year except 1993 gets one map per feature and palette
+        '''
+        jobs = batch.choropleth_jobs('maps', (1970, 2015), ['kills', 'wounds', 'casualties'], ['PuBu'])
+        self.assertEqual(45 * 3, len(jobs))
+        self.assertNotIn(1993, [job[0] for job in jobs])
+        self.assertIn((2010, 'kills', 'PuBu', os.path.join('maps', 'choropleth_2010_kills_PuBu.html')), jobs)
+
+
+    def test_heatmap_jobs(self):
+        '''
+        test the heatmap_jobs function in the batch module
+        whether every region gets one image per color map, largest first
+        '''
+        pivots = {('South Asia', 'kills'): ht.region_pivot('South Asia', 'kills'),
+                  ('Central Asia', 'kills'): ht.region_pivot('Central Asia', 'kills')}
+        heights = {'South Asia': 6, 'Central Asia': 7}
+        jobs = batch.heatmap_jobs('out', pivots, heights, ['cool', 'RdBu_r'])
+        self.assertEqual(4, len(jobs))
+        self.assertEqual('South Asia', jobs[0][0])
+        self.assertEqual(os.path.join('out', 'heatmap_Central_Asia_kills_cool.png'), jobs[2][-1])
+        self.assertEqual('Australasia_Oceania', batch.slugify('Australasia & Oceania'))
+
+
+    def test_country_report(self):
+        '''
+        test the country_report function in the AnalysisAndLinePlot module
+        and the report_html function in the batch module
+        whether the report is json serializable and agrees with the statistics
+        '''
+        profiles = al.country_profiles()
+        report = al.country_report('Spain', profiles)
+        self.assertEqual(45, len(report['years']))
+        self.assertEqual(sum(report['series']['kills']), report['statistics']['kills']['sum'])
+        self.assertEqual(report, json.loads(json.dumps(report)))
+        self.assertIn('<pre>', batch.report_html(report, 'report_Spain.png'))
+
+
+    def test_animation_jobs(self):
+        '''
+        test the animation_jobs function in the batch module
+        whether a frame is only rendered again when its data or style changes
+        '''
+        jobs = batch.animation_jobs('density', [2000, 2001], 'Plain', 'data-1', 'cache')
+        self.assertEqual(2, len(jobs))
+        self.assertEqual(('density', 2000, 'Plain'), jobs[0][:3])
+        self.assertEqual(jobs, batch.animation_jobs('density', [2000, 2001], 'Plain', 'data-1', 'cache'))
+        self.assertNotEqual(jobs[0][-1], batch.animation_jobs('density', [2000], 'Etopo', 'data-1', 'cache')[0][-1])
+        self.assertNotEqual(jobs[0][-1], batch.animation_jobs('density', [2000], 'Plain', 'data-2', 'cache')[0][-1])
+        # the bubble chart frames do not depend on the map style
+        self.assertEqual(batch.animation_jobs('bubble', ['(1995, 2000]'], 'Plain', 'data-1', 'cache')[0][-1],
+                         batch.animation_jobs('bubble', ['(1995, 2000]'], 'Etopo', 'data-1', 'cache')[0][-1])
+
+
+    def test_year_coordinates(self):
+        '''
+        test the year_coordinates function in the Geo2D module
+        '''
+        coordinates = geo.year_coordinates()
+        gt_df = self.data_creation.gt_df
+        self.assertNotIn(1993, coordinates)
+        lon, lat = coordinates[2001]
+        self.assertEqual((gt_df.year == 2001).sum(), len(lon))
+        self.assertEqual(len(gt_df), sum(len(lon) for lon, _ in coordinates.values()))
+
+
+    def test_render(self):
+        '''
+        test the headless render functions in the render module
+        whether they return images and reuse the figure between calls
+        '''
+        style = sns.axes_style()
+        png = render.render_dot_plot('occurrences', 'Armed Assault', (1990, 2000))
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        # the whitegrid style of the dot plot does not leak into the other charts
+        self.assertEqual(style, sns.axes_style())
+        n_figures = len(render._figures)
+        svg = render.render_dot_plot('casualties', 'Bombing/Explosion', (1980, 2000), fmt='svg')
+        self.assertIn(b'<svg', svg)
+        self.assertEqual(n_figures, len(render._figures))
+        with self.assertRaises(ValueError):
+            render.render_bubble_chart(2015, fmt='jpg')
+        with self.assertRaises(NoCountryDataError):
+            render.render_analy_and_plot('America', 'wounds', 'white')
+        with self.assertRaises(NoDataError):
+            render.render_choropleth('PuBu', 'kills', 1993)
+
+
+    def test_prefetch(self):
+        '''
+        test the neighbouring slider states and the Prefetcher class in the prefetch module
+        '''
+        self.assertEqual([(1971, 2000), (1970, 1999), (1970, 2001)], prefetch.adjacent_intervals((1970, 2000)))
+        self.assertEqual([(2013, 2015)], prefetch.adjacent_intervals([2014, 2015]))
+        self.assertEqual([1995], prefetch.adjacent_years(1994))
+        self.assertEqual([2014], prefetch.adjacent_years(2015.0))
+        self.assertEqual([1980], prefetch.adjacent_periods(1975))
+
+        cache = fc.FigureCache(max_entries=3, max_bytes=100)
+        prefetcher = prefetch.Prefetcher(cache, workers=1, max_bytes=6)
+        seen = fc.cache_key('choropleth', Year=2000)
+        prefetcher.requested(seen)
+        cache.get(seen, lambda: b'x' * 4)
+        prefetcher.schedule([(fc.cache_key('choropleth', Year=year), lambda: b'y' * 6)
+                             for year in prefetch.adjacent_years(2000)])
+        prefetcher.wait()
+        # the second render replaces the first one to stay within the memory budget
+        self.assertNotIn(fc.cache_key('choropleth', Year=1999), cache)
+        self.assertIn(fc.cache_key('choropleth', Year=2001), cache)
+        self.assertEqual((2, 0), (prefetcher.rendered, prefetcher.skipped))
+        self.assertEqual({'hits': 0, 'misses': 1}, {name: cache.stats()[name] for name in ('hits', 'misses')})
+
+        # a prefetched render is a hit, and no longer counts in the budget
+        prefetcher.requested(fc.cache_key('choropleth', Year=2001))
+        self.assertEqual(b'y' * 6, cache.get(fc.cache_key('choropleth', Year=2001), lambda: b''))
+        self.assertEqual({}, prefetcher.prefetched)
+
+        # nothing is prefetched once the user is idle
+        prefetcher.idle_seconds = 0
+        prefetcher.last_request -= 1
+        prefetcher.schedule([(fc.cache_key('choropleth', Year=1999), lambda: b'z')])
+        prefetcher.wait()
+        self.assertNotIn(fc.cache_key('choropleth', Year=1999), cache)
+
+        # the prefetch never evicts the renders the user has seen,
+        # only the prefetched ones not yet shown
+        cache.get(fc.cache_key('choropleth', Year=2002), lambda: b'w')
+        self.assertIsNone(cache.prefetch(fc.cache_key('choropleth', Year=2003), lambda: b'v'))
+        self.assertEqual(3, cache.stats()['entries'])
+        cache = fc.FigureCache(max_entries=2)
+        cache.get('seen', lambda: b'a')
+        cache.prefetch('first', lambda: b'b')
+        self.assertEqual(b'c', cache.prefetch('second', lambda: b'c'))
+        self.assertEqual({'seen', 'second'}, set(cache.entries))
+        prefetcher.shutdown()
+
+        # a background render waits for the renders the user asked for
+        order, started, release = [], threading.Event(), threading.Event()
+        def draw(name, is_background, hold=False):
+            with (render.background() if is_background else contextlib.nullcontext()):
+                with render._drawing():
+                    started.set()
+                    if hold:
+                        release.wait(5)
+                    order.append(name)
+        threads = [threading.Thread(target=draw, args=('running', True, True))]
+        threads[0].start()
+        started.wait(5)
+        threads.append(threading.Thread(target=draw, args=('background', True)))
+        threads[-1].start()
+        time.sleep(0.05)
+        threads.append(threading.Thread(target=draw, args=('foreground', False)))
+        threads[-1].start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(['running', 'foreground', 'background'], order)
+
+
+    def test_latest_render(self):
+        '''
+        test the LatestRender class in the live module
+        whether only the output of the latest request is shown
+        '''
+        started, shown = [], []
+        release = threading.Event()
+        def render(Year):
+            started.append(Year)
+            if Year == 2000:
+                release.wait(5)
+            if Year == 1993:
+                raise NoDataError
+            return Year
+        latest = live.LatestRender(render, shown.append, delay=0.05)
+
+        # the requests of a quick slider move are debounced into one render
+        for year in range(1990, 1996):
+            latest.request(Year=year)
+        latest.wait()
+        self.assertEqual([1995], started)
+        self.assertEqual([1995], shown)
+
+        # a running render is dropped when a newer request arrives
+        latest.request(Year=2000)
+        while 2000 not in started:
+            time.sleep(0.01)
+        latest.request(Year=2001)
+        release.set()
+        latest.wait()
+        self.assertEqual([1995, 2001], shown)
+        self.assertEqual(1, latest.dropped)
+
+        # the errors of invalid states are shown as their message
+        latest.request(Year=1993)
+        latest.wait()
+        self.assertEqual(str(NoDataError()), shown[-1])
+
+        # a request arriving during the wait is waited for too
+        latest.request(Year=2005)
+        threading.Timer(0.02, latest.request, kwargs={'Year': 2006}).start()
+        latest.wait()
+        self.assertEqual(2006, shown[-1])
+
+
+    def test_disk_cache(self):
+        '''
+        test the persistent decorator in the disk_cache module
+        whether a result is read from disk until the dataset file changes
+        '''
+        calls = []
+        def square(x):
+            calls.append(x)
+            return x * x
+        cached_square = disk_cache.persistent(square)
+        saved = (disk_cache.CACHE_DIR, disk_cache.DATA_FILE, disk_cache.CACHE_VERSION)
+        with tempfile.TemporaryDirectory() as tmp:
+            disk_cache.configure(cache_dir=os.path.join(tmp, 'cache'))
+            disk_cache.DATA_FILE = os.path.join(tmp, 'data.csv')
+            try:
+                with open(disk_cache.DATA_FILE, 'w') as data_file:
+                    data_file.write('a\n1\n')
+                self.assertEqual(9, cached_square(3))
+                self.assertEqual(9, cached_square(3))
+                self.assertEqual([3], calls)
+                # the same call with a keyword argument
+                self.assertEqual(9, cached_square(x=3))
+                self.assertEqual([3], calls)
+                cached_square(4)
+                self.assertEqual(2, len(os.listdir(disk_cache.CACHE_DIR)))
+
+                # a new dataset invalidates the results, the outdated file is replaced
+                with open(disk_cache.DATA_FILE, 'w') as data_file:
+                    data_file.write('a\n12\n')
+                self.assertEqual(9, cached_square(3))
+                self.assertEqual([3, 4, 3], calls)
+                self.assertEqual(2, len(os.listdir(disk_cache.CACHE_DIR)))
+
+                # so does a new version of the code of the package
+                disk_cache.CACHE_VERSION += 1
+                self.assertEqual(9, cached_square(3))
+                self.assertEqual([3, 4, 3, 3], calls)
+
+                disk_cache.evict(max_bytes=0)
+                self.assertEqual([], os.listdir(disk_cache.CACHE_DIR))
+            finally:
+                disk_cache.configure(cache_dir=saved[0])
+                disk_cache.DATA_FILE = saved[1]
+                disk_cache.CACHE_VERSION = saved[2]
+
+
+    def test_figure_cache(self):
+        '''
+        test the FigureCache class in the figure_cache module
+        whether it is bounded by entries and bytes and counts hits and misses
+        '''
+        self.assertEqual(fc.cache_key('dot_plot', year_range=[1990, 2000], metric=' casualties'),
+                         fc.cache_key('dot_plot', metric='casualties', year_range=(np.int64(1990), 2000.0)))
+        # the charts are rendered with the values they are keyed by
+        self.assertEqual({'metric': 'casualties', 'year_range': (1990, 2000)},
+                         fc.normalize_params(metric=' casualties', year_range=[np.int64(1990), 2000.0]))
+        cache = fc.FigureCache(max_entries=2, max_bytes=10)
+        self.assertEqual(b'abcd', cache.get('a', lambda: b'abcd'))
+        cache.get('b', lambda: b'efgh')
+        self.assertEqual(b'abcd', cache.get('a', lambda: b'changed'))
+        cache.get('c', lambda: b'ijkl')
+        # 'b' is the least recently used
+        self.assertEqual(['a', 'c'], list(cache.entries))
+        cache.get('d', lambda: b'0123456')
+        self.assertEqual(['d'], list(cache.entries))
+        cache.get('e', lambda: b'too large for the cache')
+        self.assertNotIn('e', cache.entries)
+        self.assertEqual({'hits': 1, 'misses': 5, 'hit_rate': 1 / 6, 'entries': 1, 'bytes': 7}, cache.stats())
+
+        # a revisited widget state is not rendered again
+        figure_cache = fc.FigureCache()
+        key = fc.cache_key('bubble_chart', year=2015)
+        png = figure_cache.get(key, lambda: render.render_bubble_chart(2015))
+        self.assertIs(png, figure_cache.get(key, lambda: render.render_bubble_chart(2015)))
+        self.assertEqual(1, figure_cache.stats()['hits'])
+
+
+    def test_server(self):
+        '''
+        test the QueryServer of the server module on localhost
+        whether the endpoints answer in json, normalized queries hit the cache
+        and the errors get their http status
+        '''
+        async def get(port, path):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write('GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.format(path).encode())
+            response = await reader.read()
+            writer.close()
+            head, body = response.split(b'\r\n\r\n', 1)
+            return int(head.split()[1]), json.loads(body.decode())
+
+        async def scenario():
+            query_server = server.QueryServer(port=0)
+            await query_server.start()
+            port = query_server.port
+            status, body = await get(port, '/choropleth?year=2012&feature=wounds')
+            self.assertEqual(200, status)
+            self.assertEqual(7000, body['scale_max'])
+            self.assertIsNone(body['values']['United Arab Emirates'])
+            status, body = await get(port, '/topk?attacktype=Armed%20Assault&start=1980&end=1990&k=5')
+            self.assertEqual(5, len(body['top']))
+            status, again = await get(port, '/topk?k=5&end=1990&start=1980&attacktype=%20Armed%20Assault')
+            self.assertEqual(body, again)
+            self.assertEqual(404, (await get(port, '/stats?country=America'))[0])
+            self.assertEqual(400, (await get(port, '/pivot?feature=kills'))[0])
+            status, metrics = await get(port, '/metrics')
+            self.assertEqual(1, metrics['endpoints']['/topk']['cache_hits'])
+            self.assertEqual(2, metrics['endpoints']['/topk']['requests'])
+
+            # a slow query is answered with 504, an unexpected error with 500
+            query_server.timeout = 0.05
+            endpoints = dict(server.ENDPOINTS)
+            server.ENDPOINTS['/slow'] = (lambda: time.sleep(0.5), {})
+            try:
+                self.assertEqual(504, (await get(port, '/slow'))[0])
+            finally:
+                server.ENDPOINTS.clear()
+                server.ENDPOINTS.update(endpoints)
+            query_server.query = None
+            status, body = await get(port, '/stats?country=Spain')
+            self.assertEqual(500, status)
+            await query_server.close()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(scenario())
+        loop.close()
+
+
     def test_plot_2D_density(self):
         '''
         test the plot_2D_density funtion in the Geo2D module
@@ -363,6 +926,132 @@ class UserTest(unittest.TestCase):
         self.assertTrue(np.ndarray, type(ctr_dict['East Asia']))
         self.assertIn('Vatican City', ctr_dict['Western Europe'])
 
+        # test the region index against scanning the data region by region
+        for region in gta.region_names:
+            expected = gta.gt_df[gta.gt_df.region == region].dropna().country.unique()
+            self.assertEqual(list(expected), list(ctr_dict[region]))
+            self.assertEqual(len(expected), gta.region_country_counts[region])
+
+
+    def test_region_pivot(self):
+        '''
+        test the region_pivot function in the heatmap module
+        whether the cached pivot table has the same values as grouping the region's data
+        '''
+        pivot = ht.region_pivot('South Asia', 'kills')
+        gt_df = self.data_creation.gt_df
+        south_asia = gt_df[gt_df.region == 'South Asia']
+        expected = south_asia.groupby(['country', 'year']).kills.sum().unstack('year').fillna(0)
+        self.assertEqual(expected.shape, pivot.shape)
+        self.assertEqual(south_asia.kills.sum(), pivot.values.sum())
+        self.assertEqual(expected.loc['India', 2010], pivot.loc['India', 2010])
+        # the second call is served by the cache
+        hits = ht.region_pivot.cache_info().hits
+        ht.region_pivot('South Asia', 'kills')
+        self.assertEqual(hits + 1, ht.region_pivot.cache_info().hits)
+
+
+    def test_fast_heatmap(self):
+        '''
+        test whether the whole world heatmap in the heatmap module
+        contains all the countries and is drawn as a single image
+        '''
+        pivot = ht.region_pivot(ht.ALL_REGIONS, 'casualties')
+        self.assertEqual(self.data_creation.gt_df.country.nunique(), pivot.shape[0])
+        self.assertEqual(self.data_creation.gt_df.casualties.sum(), pivot.values.sum())
+        self.assertTrue(ht.use_fast_heatmap(pivot))
+        self.assertFalse(ht.use_fast_heatmap(pivot, fast=False))
+        self.assertFalse(ht.use_fast_heatmap(ht.region_pivot('Central Asia', 'casualties')))
+
+
+    def test_rolling_stats(self):
+        '''
+        test the rolling statistics in the trends module against pandas' rolling windows
+        '''
+        values = np.random.RandomState(0).poisson(5, size=(4, 12)).astype(float)
+        frame = pd.DataFrame(values.T)
+        for function, expected in [(trends.rolling_mean, frame.rolling(3).mean()),
+                                   (trends.rolling_std, frame.rolling(3).std()),
+                                   (trends.rolling_max, frame.rolling(3).max()),
+                                   (lambda v, w: trends.year_over_year(v), frame.diff())]:
+            self.assertTrue(np.allclose(expected.values.T, function(values, 3), equal_nan=True))
+
+        matrix = pd.DataFrame([[0, 0, 0, 0, 10, 10], [10, 10, 10, 1, 1, 1], [5] * 6],
+                              index=['up', 'down', 'flat'])
+        flags = trends.RollingStats(matrix, window=2).trend_flags()
+        self.assertEqual(['rising', 'falling', 'stable'], list(flags))
+        with self.assertRaises(ValueError):
+            trends.RollingStats(matrix, window=4).trend_flags()
+
+
+    def test_country_trends(self):
+        '''
+        test the trend table in AnalysisAndLinePlot module
+        '''
+        table = al.country_profiles().trend_table()
+        self.assertEqual((207, 4), table.shape)
+        self.assertTrue(set(table.values.ravel()) <= {'rising', 'falling', 'stable'})
+        self.assertIn(al.country_trends('Iraq')['casualties'], ['rising', 'falling', 'stable'])
+
+
+    def test_detect_anomalies(self):
+        '''
+        test the detect_anomalies function in the anomaly module
+        whether a spike above the recent baseline is flagged and ranked first
+        '''
+        years = list(range(2000, 2010))
+        matrix = pd.DataFrame([[5, 6, 5, 4, 6, 5, 60, 5, 6, 5],
+                               [5, 6, 5, 4, 6, 5, 9, 5, 6, 5],
+                               [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]],
+                              index=['spike', 'small', 'growth'], columns=years)
+        anomalies = anomaly.detect_anomalies({'occurrences': matrix, 'casualties': matrix * 2})
+        self.assertEqual(['country', 'year', 'metric', 'value', 'baseline', 'score'], list(anomalies.columns))
+        self.assertEqual(('spike', 2006), tuple(anomalies.loc[0, ['country', 'year']]))
+        self.assertEqual({'spike'}, set(anomalies.country))
+        self.assertTrue((anomalies.score.diff().dropna() <= 0).all())
+        scores, baselines = anomaly.robust_zscores(matrix.values)
+        self.assertTrue(np.isnan(scores[:, :5]).all())
+        self.assertEqual(5, baselines[0, 6])
+
+
+    def test_country_anomalies(self):
+        '''
+        test the spikes in AnalysisAndLinePlot module
+        '''
+        spikes = al.country_anomalies('Iraq')
+        self.assertTrue((spikes.country == 'Iraq').all())
+        self.assertTrue(set(spikes.metric) <= set(al.ANOMALY_METRICS))
+        self.assertIn('Sudden Spikes', al.analy_ctr('Iraq'))
+
+
+    def test_holt_forecast(self):
+        '''
+        test the forecast module
+        whether a linear series is extrapolated exactly and the intervals widen
+        '''
+        matrix = pd.DataFrame([np.arange(10) * 3.0 + 2, np.full(10, 7.0)],
+                              index=['linear', 'flat'], columns=range(2000, 2010))
+        fitted = forecast.HoltForecast(matrix, horizon=3)
+        self.assertEqual([2010, 2011, 2012], list(fitted.forecast.columns))
+        self.assertTrue(np.allclose([32, 35, 38], fitted.forecast.loc['linear']))
+        self.assertTrue(np.allclose([7, 7, 7], fitted.forecast.loc['flat']))
+
+        noisy = pd.DataFrame([[5, 9, 4, 8, 6, 10, 5, 9, 7, 11]], columns=range(2000, 2010))
+        noisy_fit = forecast.HoltForecast(noisy, horizon=4)
+        widths = (noisy_fit.upper - noisy_fit.lower).values[0]
+        self.assertTrue((np.diff(widths) >= 0).all())
+        self.assertTrue((noisy_fit.lower.values >= 0).all())
+
+
+    def test_country_forecast(self):
+        '''
+        test the forecasts in AnalysisAndLinePlot module
+        '''
+        result = al.country_forecast('Chile', 'occurrences', 3)
+        self.assertEqual([2016, 2017, 2018], list(result.index))
+        self.assertTrue((result.lower <= result.forecast).all())
+        self.assertTrue((result.forecast <= result.upper).all())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,135 @@
+'''
+This module computes rolling statistics of yearly series
+for all the countries at once, on a country x year matrix:
+    - moving average and rolling standard deviation, from cumulative sums
+    - rolling maximum, from a strided view of the windows
+    - year-over-year change
+    - trend flags of every country
+
+The columns of the matrix are the years in the GT Database,
+so a window spanning 1993 covers one more calendar year.
+
+Module Author: Xianzhi Cao (xc965)
+Project co-author: Caroline Roper (cer446)
+'''
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import as_strided
+
+
+def _window_sums(values, window):
+    '''
+    Return the sums over every window of the rows,
+    the first window-1 columns have no complete window   | np.array
+    '''
+    cumsum = np.cumsum(values, axis=1)
+    sums = cumsum[:, window - 1:].copy()
+    sums[:, 1:] -= cumsum[:, :-window]
+    return sums
+
+
+def _pad(result, n_columns):
+    '''
+    Return the result right-aligned in n_columns, NaN before the first window   | np.array
+    '''
+    padded = np.full((result.shape[0], n_columns), np.nan)
+    padded[:, n_columns - result.shape[1]:] = result
+    return padded
+
+
+def sliding_windows(values, window):
+    '''
+    Parameters
+        - values: one series per row                   | np.array
+        - window: number of years in the window         | int
+    Return
+        read-only view of the windows of every row,
+        of shape (rows, columns - window + 1, window)   | np.array
+    '''
+    values = np.ascontiguousarray(values, dtype=float)
+    rows, columns = values.shape
+    row_stride, column_stride = values.strides
+    return as_strided(values, shape=(rows, columns - window + 1, window),
+                      strides=(row_stride, column_stride, column_stride), writeable=False)
+
+
+def rolling_mean(values, window):
+    '''
+    Return the moving average of every row, NaN before the first window   | np.array
+    '''
+    values = np.asarray(values, dtype=float)
+    return _pad(_window_sums(values, window) / window, values.shape[1])
+
+
+def rolling_std(values, window):
+    '''
+    Return the rolling sample standard deviation of every row,
+    NaN before the first window                                   | np.array
+    '''
+    values = np.asarray(values, dtype=float)
+    sums = _window_sums(values, window)
+    squares = _window_sums(values ** 2, window)
+    variance = (squares - sums ** 2 / window) / (window - 1)
+    # cancellation may leave tiny negative values
+    return _pad(np.sqrt(np.clip(variance, 0, None)), values.shape[1])
+
+
+def rolling_max(values, window):
+    '''
+    Return the rolling maximum of every row, NaN before the first window   | np.array
+    '''
+    values = np.asarray(values, dtype=float)
+    return _pad(sliding_windows(values, window).max(axis=2), values.shape[1])
+
+
+def year_over_year(values):
+    '''
+    Return the change from the previous year of every row, NaN for the first year   | np.array
+    '''
+    values = np.asarray(values, dtype=float)
+    return _pad(np.diff(values, axis=1), values.shape[1])
+
+
+class RollingStats(object):
+    '''
+    Attributes:
+        - self.window: number of years in the window
+        - self.mean:   moving average             | DataFrame
+        - self.std:    rolling standard deviation | DataFrame
+        - self.max:    rolling maximum            | DataFrame
+        - self.change: year-over-year change      | DataFrame
+        all of them indexed by country with a column per year
+    Method:
+        - flag the recent trend of every country
+    '''
+    def __init__(self, matrix, window=5):
+        if not 1 < window <= matrix.shape[1]:
+            raise ValueError('The window must be between 2 and {} years.'.format(matrix.shape[1]))
+        self.window = window
+        values = matrix.values.astype(float)
+        as_frame = lambda result: pd.DataFrame(result, index=matrix.index, columns=matrix.columns)
+        self.mean = as_frame(rolling_mean(values, window))
+        self.std = as_frame(rolling_std(values, window))
+        self.max = as_frame(rolling_max(values, window))
+        self.change = as_frame(year_over_year(values))
+
+    def trend_flags(self, threshold=0.25):
+        '''
+        Parameter
+            - threshold: relative change of the moving average
+                         above which the trend is not stable     | float
+        Return
+            'rising', 'falling' or 'stable' for every country, comparing the
+            moving average of the last window with the one before it        | Series
+        '''
+        if 2 * self.window > self.mean.shape[1]:
+            raise ValueError('Two windows of {} years do not fit in the series.'.format(self.window))
+        mean = self.mean.values
+        last = mean[:, -1]
+        previous = mean[:, -1 - self.window]
+        # a baseline under one attack a year is treated as one, to avoid flagging noise
+        relative = (last - previous) / np.maximum(previous, 1)
+        flags = np.select([relative > threshold, relative < -threshold],
+                          ['rising', 'falling'], default='stable')
+        return pd.Series(flags, index=self.mean.index, name='trend')
@@ -122,6 +122,57 @@ def count_by_groups(grouped):
     counts.columns = ['count']
     return counts
 
+def combine_dtypes(dtype, other):
+    '''Returns the dtype of a column read at once, from its dtypes in two chunks, e.g. int64 and float64 (a chunk with missing values) give float64'''
+    if dtype is None:
+        return other
+    if pd.api.types.is_numeric_dtype(dtype) and pd.api.types.is_numeric_dtype(other):
+        return np.result_type(dtype, other)
+    # a chunk with only missing values of a text column is read as float
+    return other if pd.api.types.is_numeric_dtype(dtype) else dtype
+
+def cast_index(groups, dtypes):
+    '''Casts the levels of the row index of sums or counts by groups to the dtypes of their columns'''
+    groups = groups.copy()
+    if groups.index.nlevels == 1:
+        groups.index = groups.index.astype(dtypes[groups.index.name])
+    else:
+        groups.index = groups.index.set_levels([level.astype(dtypes[level.name]) for level in groups.index.levels])
+    return groups
+
+def fold_groups(totals, part, dtypes):
+    '''Adds the sums or counts by groups of a chunk to the running totals, summing the rows of the groups found in both, with the key dtypes of the chunks read so far'''
+    part = cast_index(part, dtypes)
+    if totals is None:
+        return part
+    levels = list(range(part.index.nlevels))
+    return pd.concat([cast_index(totals, dtypes), part]).groupby(level=levels).sum()
+
+def aggregate_chunks(chunks, columns, column_to_agg):
+    '''Takes an iterable of DataFrames, returns the outputs of sum_by_groups and count_by_groups of their concatenation, holding one chunk and the totals in memory'''
+    sums = counts = None
+    dtypes = dict.fromkeys(columns + [column_to_agg])
+    for chunk in chunks:
+        # the keys and the sums have the dtypes of the whole file, not of the chunk,
+        # including the chunks without any group, e.g. a column of missing values read as float
+        for column in columns + [column_to_agg]:
+            dtypes[column] = combine_dtypes(dtypes[column], chunk[column].dtype)
+        grouped = group_by_columns(chunk, columns, column_to_agg)
+        chunk_sums = sum_by_groups(grouped)
+        if chunk_sums.empty:
+            continue
+        sums = fold_groups(sums, chunk_sums, dtypes)
+        counts = fold_groups(counts, count_by_groups(grouped), dtypes)
+    if sums is not None:
+        sums, counts = cast_index(sums, dtypes), cast_index(counts, dtypes)
+        sums['sum'] = sums['sum'].astype(combine_dtypes(sums['sum'].dtype, dtypes[column_to_agg]))
+    return sums, counts
+
+def stream_group_aggregates(columns, column_to_agg, path='gtd_wholedata_selected.csv', chunksize=None):
+    '''Reads the dataset file (csv or HDF5 store) in chunks and returns the sums and counts by groups, for files larger than memory'''
+    chunks = data.iter_df_chunks(path, columns + [column_to_agg], chunksize or data.CHUNKSIZE)
+    return aggregate_chunks(chunks, columns, column_to_agg)
+
 def create_range(series_to_group, group_size):
     '''Turns a series into groups of a specified size'''
     bins = np.arange(min(series_to_group) - group_size, max(series_to_group) + group_size, group_size)